@@ -3,15 +3,13 @@ API for interacting with a CloudMan instance.
 """
 import functools
 import json
-import time
 
 import requests
-from six.moves import range
 from six.moves.urllib.parse import urlparse
 
 import bioblend
 from bioblend.cloudman.launch import CloudManLauncher
-from bioblend.util import Bunch
+from bioblend.util import Backoff, Bunch, wait_for
 
 
 def block_until_vm_ready(func):
@@ -328,19 +326,25 @@ class GenericVMInstance(object):
         if self.host_name:  # Host name available. Therefore, instance is ready
             return
 
-        for time_left in range(vm_ready_timeout, 0, -vm_ready_check_interval):
+        def instance_ready():
             status = self.get_machine_status()
             if status['public_ip'] != '' and status['error'] == '':
                 self._init_instance(status['public_ip'])
-                return
+                return True
             elif status['error'] != '':
                 msg = "Error launching an instance: {0}".format(status['error'])
                 bioblend.log.error(msg)
                 raise VMLaunchException(msg)
-            else:
-                bioblend.log.warn("Instance not ready yet (it's in state '{0}'); waiting another {1} seconds..."
-                                  .format(status['instance_state'], time_left))
-                time.sleep(vm_ready_check_interval)
+            bioblend.log.warn("Instance not ready yet (it's in state '{0}')"
+                              .format(status['instance_state']))
+            return False
+
+        # Poll often at first, then back off up to vm_ready_check_interval
+        backoff = Backoff(initial_delay=min(1, vm_ready_check_interval),
+                          max_delay=vm_ready_check_interval,
+                          timeout=vm_ready_timeout)
+        if wait_for(instance_ready, backoff):
+            return
 
         raise VMLaunchException("Waited too long for instance to become ready. Instance Id: %s"
                                 % self.instance_id)
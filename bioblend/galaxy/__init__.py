@@ -1,16 +1,18 @@
 """
 A base representation of an instance of Galaxy
 """
-from bioblend.galaxy.client import Client
 from bioblend.galaxy import (libraries, histories, workflows, datasets, users,
                              genomes, tools, toolshed, config, visual, quotas,
                              groups, datatypes, jobs, forms, ftpfiles, folders,
                              roles, tool_data)
-from bioblend.galaxyclient import GalaxyClient
+from bioblend.galaxyclient import GalaxyClient, POOL_CONNECTIONS, POOL_MAXSIZE
 
 
 class GalaxyInstance(GalaxyClient):
-    def __init__(self, url, key=None, email=None, password=None):
+    def __init__(self, url, key=None, email=None, password=None,
+                 pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                 retry_policy=None, cache=None, conditional_get=None,
+                 json_codec=None):
         """
         A base representation of an instance of Galaxy, identified by a
         URL and a user's API key.
@@ -46,8 +48,62 @@ class GalaxyInstance(GalaxyClient):
         :param password: Password of Galaxy account corresponding to the above
                          e-mail address. Ignored if key is supplied directly.
 
+        :type pool_connections: int
+        :param pool_connections: Number of per-host connection pools to keep.
+
+        :type pool_maxsize: int
+        :param pool_maxsize: Maximum number of keep-alive connections to keep
+                             for each host. All the client modules share the
+                             same HTTP session, so this bounds the number of
+                             connections reused by concurrent requests.
+
+        :type retry_policy: :class:`~bioblend.galaxy.client.RetryPolicy`
+        :param retry_policy: How failed requests to this instance are retried.
+                             If not provided, a default policy is created,
+                             which retries the idempotent GET, HEAD, PUT and
+                             DELETE requests but not POST ones, as configured
+                             by ``max_get_attempts`` and ``get_retry_delay``.
+                             Despite their names, these two attributes apply
+                             to all the retried methods. The policy is
+                             available as the ``retry_policy`` attribute.
+
+        :type cache: :class:`~bioblend.galaxy.client.ResponseCache` or bool
+        :param cache: Cache for the responses of the endpoints returning large
+                      and rarely changing payloads (tools, datatypes, genomes,
+                      configuration, tool data tables). Set to ``True`` to
+                      use a cache with the default settings. Disabled by
+                      default. The cache is available as the ``cache``
+                      attribute, e.g. to invalidate it after installing tools
+                      with ``gi.cache.invalidate('tools')``.
+
+        :type conditional_get: :class:`~bioblend.galaxy.client.ConditionalGetCache` or bool
+        :param conditional_get: Store for the ``ETag`` and ``Last-Modified``
+                                validators of the responses, so that the
+                                next GET requests for the same URLs are
+                                conditional and a ``304 Not Modified`` answer
+                                is served from the stored response. Set to
+                                ``True`` to use a store with the default
+                                settings. Disabled by default. The store is
+                                available as the ``conditional_get``
+                                attribute, whose ``hits`` counts the 304
+                                answers.
+
+        :type json_codec: :class:`~bioblend.util.JSONCodec`
+        :param json_codec: How the JSON request and response bodies are
+                           encoded and decoded. By default, with the
+                           standard library ``json`` module. Pass
+                           ``bioblend.util.JSONCodec()`` to use the
+                           fastest JSON library installed among those
+                           supported (orjson, ujson) instead. Also used by
+                           the wrappers of :mod:`bioblend.galaxy.objects`.
         """
-        super(GalaxyInstance, self).__init__(url, key, email, password)
+        super(GalaxyInstance, self).__init__(url, key, email, password,
+                                             pool_connections=pool_connections,
+                                             pool_maxsize=pool_maxsize,
+                                             retry_policy=retry_policy,
+                                             cache=cache,
+                                             conditional_get=conditional_get,
+                                             json_codec=json_codec)
         self.libraries = libraries.LibraryClient(self)
         self.histories = histories.HistoryClient(self)
         self.workflows = workflows.WorkflowClient(self)
@@ -70,19 +126,19 @@ class GalaxyInstance(GalaxyClient):
 
     @property
     def max_get_attempts(self):
-        return Client.max_get_retries()
+        return self.retry_policy.max_attempts
 
     @max_get_attempts.setter
     def max_get_attempts(self, v):
-        Client.set_max_get_retries(v)
+        self.retry_policy.max_attempts = v
 
     @property
     def get_retry_delay(self):
-        return Client.get_retry_delay()
+        return self.retry_policy.retry_delay
 
     @get_retry_delay.setter
     def get_retry_delay(self, v):
-        Client.set_get_retry_delay(v)
+        self.retry_policy.retry_delay = v
 
     def __repr__(self):
         """
@@ -0,0 +1,124 @@
+"""
+An asyncio-friendly representation of an instance of Galaxy.
+
+Each client module exposes the same methods as its counterpart in
+:class:`bioblend.galaxy.GalaxyInstance`, but calling them returns an
+awaitable future instead of blocking until Galaxy replies, e.g.::
+
+    import asyncio
+    from bioblend.galaxy.aio import GalaxyInstance
+
+    gi = GalaxyInstance('http://127.0.0.1:8080', key='your_api_key')
+
+    loop = asyncio.get_event_loop()
+    jobs = loop.run_until_complete(
+        asyncio.gather(*[gi.jobs.show_job(_) for _ in job_ids]))
+
+Requests are executed by a bounded pool of worker threads sharing the
+keep-alive HTTP session of the underlying instance, so URL composition,
+authentication and retry semantics are exactly the same as for the
+blocking API.
+
+.. note::
+  This module requires Python 3.4 or later.
+"""
+import asyncio
+import concurrent.futures
+import functools
+
+import bioblend.galaxy
+from bioblend.galaxy.client import Client
+
+# Default maximum number of requests in flight at the same time
+MAX_CONCURRENCY = 10
+
+
+class AsyncClient(object):
+    """
+    Wrap a :class:`~bioblend.galaxy.client.Client`, making each of its
+    public methods return an awaitable future.
+    """
+    def __init__(self, client, async_gi):
+        self.client = client
+        self.async_gi = async_gi
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def submit(*args, **kwargs):
+            return self.async_gi._submit(attr, *args, **kwargs)
+        return submit
+
+    def __repr__(self):
+        return "AsyncClient(%r)" % (self.client,)
+
+
+class GalaxyInstance(object):
+    def __init__(self, url, key=None, email=None, password=None,
+                 max_concurrency=MAX_CONCURRENCY, loop=None, **kwargs):
+        """
+        An asyncio-friendly representation of an instance of Galaxy,
+        identified by a URL and a user's API key.
+
+        See :class:`bioblend.galaxy.GalaxyInstance` for the ``url``, ``key``,
+        ``email`` and ``password`` parameters.
+
+        :type max_concurrency: int
+        :param max_concurrency: Maximum number of requests in flight at the
+                                same time. Further requests are queued until
+                                a previous one completes.
+
+        :type loop: :class:`asyncio.AbstractEventLoop`
+        :param loop: Event loop on which the futures are created. If not
+                     provided, the current event loop at the time of each
+                     call is used.
+
+        Any other keyword argument (e.g. ``retry_policy``, ``cache``,
+        ``conditional_get`` or ``json_codec``) is passed to the underlying
+        :class:`bioblend.galaxy.GalaxyInstance`.
+        """
+        if max_concurrency < 1:
+            raise ValueError("Concurrency must be >= 1 (got: %s)" % max_concurrency)
+        kwargs.setdefault('pool_maxsize', max_concurrency)
+        self.gi = bioblend.galaxy.GalaxyInstance(url, key, email, password,
+                                                 **kwargs)
+        self.max_concurrency = max_concurrency
+        self._loop = loop
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_concurrency)
+        for name, value in vars(self.gi).items():
+            if isinstance(value, Client):
+                setattr(self, name, AsyncClient(value, self))
+
+    @property
+    def url(self):
+        return self.gi.url
+
+    @property
+    def base_url(self):
+        return self.gi.base_url
+
+    def _submit(self, f, *args, **kwargs):
+        """
+        Schedule ``f(*args, **kwargs)`` on the worker pool and return an
+        asyncio future for its result.
+        """
+        loop = self._loop or asyncio.get_event_loop()
+        return loop.run_in_executor(self._executor,
+                                    functools.partial(f, *args, **kwargs))
+
+    def close(self):
+        """
+        Shut down the worker pool and close the HTTP connections. Requests
+        already submitted are completed first.
+        """
+        self._executor.shutdown(wait=True)
+        self.gi.close()
+
+    def __repr__(self):
+        """
+        A nicer representation of this GalaxyInstance object
+        """
+        return "Async GalaxyInstance object for Galaxy at {0}".format(self.base_url)
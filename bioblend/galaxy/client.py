@@ -5,10 +5,11 @@ This class is primarily a helper for the library and user code
 should not use it directly.
 """
 
-import json
+import threading
 import time
 
 import requests
+import six
 try:
     # The following import will work only for Requests >= 2.4.0 and is
     # needed to workaround its "urllib3.exceptions.ProtocolError not
@@ -20,6 +21,7 @@ except ImportError:
     ProtocolError = None  # pylint: disable=C0103
 
 import bioblend as bb
+from bioblend.util import Backoff, concurrent_map, iter_json_array
 
 
 class ConnectionError(Exception):
@@ -29,20 +31,380 @@ class ConnectionError(Exception):
     Should make it easier to debug when strange HTTP things happen such as a
     proxy server getting in the way of the request etc.
     @see: body attribute to see the content of the http response
+    @see: status_code attribute to see the HTTP status code, if any
     """
-    def __init__(self, message, body=None):
+    def __init__(self, message, body=None, status_code=None):
         super(ConnectionError, self).__init__(message)
         self.body = body
+        self.status_code = status_code
 
     def __str__(self):
         return "{0}: {1}".format(self.args[0], self.body)
 
 
+# Exceptions raised by requests when the connection to the server fails
+CONNECTION_EXCEPTIONS = tuple(
+    _ for _ in (requests.exceptions.ConnectionError, ProtocolError) if _ is not None)
+
+# Size of the chunks read from streamed JSON responses
+STREAM_CHUNK_SIZE = 65536
+
+
+def _params_key(params):
+    """
+    Return a hashable key for the query ``params`` of a request, ignoring
+    the API key.
+    """
+    return tuple(sorted((k, str(v)) for k, v in (params or {}).items() if k != 'key'))
+
+
+class RetryPolicy(object):
+    """
+    Configure how failed requests to a Galaxy (or Tool Shed) instance are
+    retried. Each instance has its own policy, see the ``retry_policy``
+    attribute of :class:`~bioblend.galaxy.GalaxyInstance`.
+
+    GET requests made by the clients are retried on any failure (including
+    an empty or undecodable response). Other requests are retried only on
+    connection errors and on the HTTP status codes in ``retry_statuses``,
+    i.e. the typical answers of a proxy in front of a busy or restarting
+    Galaxy. POST requests are not idempotent (e.g. running the same tool
+    twice starts two jobs), so they are retried only if
+    ``retry_non_idempotent`` is ``True``. Requests with attached files are
+    never retried, since their payload can only be read once.
+
+    :type max_attempts: int
+    :param max_attempts: maximum number of attempts for a request, a value of
+      1 disables retries. Defaults to ``Client.max_get_retries()``
+
+    :type retry_delay: float
+    :param retry_delay: delay (in seconds) before the first retry, further
+      retries back off exponentially. Defaults to
+      ``Client.get_retry_delay()``
+
+    :type max_delay: float
+    :param max_delay: maximum delay (in seconds) between retries, unless
+      ``retry_delay`` is longer
+
+    :type retry_statuses: collection of int
+    :param retry_statuses: HTTP status codes which cause a retry of requests
+      other than GET
+
+    :type retry_non_idempotent: bool
+    :param retry_non_idempotent: if ``True``, also retry POST requests
+    """
+    IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE'])
+
+    def __init__(self, max_attempts=None, retry_delay=None, max_delay=60,
+                 retry_statuses=(502, 503, 504), retry_non_idempotent=False):
+        if max_attempts is None:
+            max_attempts = Client.max_get_retries()
+        if retry_delay is None:
+            retry_delay = Client.get_retry_delay()
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_delay = max_delay
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_non_idempotent = retry_non_idempotent
+
+    @property
+    def max_attempts(self):
+        return self._max_attempts
+
+    @max_attempts.setter
+    def max_attempts(self, value):
+        if value < 1:
+            raise ValueError("Number of retries must be >= 1 (got: %s)" % value)
+        self._max_attempts = value
+
+    @property
+    def retry_delay(self):
+        return self._retry_delay
+
+    @retry_delay.setter
+    def retry_delay(self, value):
+        if value < 0:
+            raise ValueError("Retry delay must be >= 0 (got: %s)" % value)
+        self._retry_delay = value
+
+    def backoff(self):
+        """
+        Return the schedule of delays between retries.
+        """
+        return Backoff(initial_delay=self.retry_delay,
+                       max_delay=max(self.retry_delay, self.max_delay))
+
+    def attempts(self, method):
+        """
+        Return the maximum number of attempts for a request with the given
+        HTTP ``method``.
+        """
+        if method.upper() in self.IDEMPOTENT_METHODS or self.retry_non_idempotent:
+            return self.max_attempts
+        return 1
+
+    def __repr__(self):
+        return ("RetryPolicy(max_attempts=%r, retry_delay=%r, max_delay=%r, "
+                "retry_statuses=%r, retry_non_idempotent=%r)" % (
+                    self.max_attempts, self.retry_delay, self.max_delay,
+                    sorted(self.retry_statuses), self.retry_non_idempotent))
+
+
+class _LRUDict(object):
+    """
+    Minimal mapping keeping its keys in least recently used order, which
+    evicts the least recently used keys beyond ``maxsize``. Looking up or
+    setting a key marks it as the most recently used.
+
+    If ``maxbytes`` is given, the least recently used keys are also evicted
+    while the total size of the values, as computed by ``sizeof``, exceeds
+    it.
+
+    ``collections.OrderedDict`` is not used as it is not available on
+    Python 2.6.
+    """
+    def __init__(self, maxsize, maxbytes=None, sizeof=len):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self._data = {}
+        # Keys, least recently used first
+        self._order = []
+
+    def get(self, key, default=None):
+        if key not in self._data:
+            return default
+        self._order.remove(key)
+        self._order.append(key)
+        return self._data[key]
+
+    def pop(self, key, default=None):
+        if key not in self._data:
+            return default
+        value = self._data[key]
+        del self[key]
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self._data:
+            del self[key]
+        self._data[key] = value
+        self._order.append(key)
+        if self.maxbytes is not None:
+            self.nbytes += self.sizeof(value)
+        while len(self._order) > self.maxsize or (
+                self.maxbytes is not None and self.nbytes > self.maxbytes):
+            del self[self._order[0]]
+
+    def __delitem__(self, key):
+        self._order.remove(key)
+        value = self._data.pop(key)
+        if self.maxbytes is not None:
+            self.nbytes -= self.sizeof(value)
+
+    def __iter__(self):
+        return iter(list(self._order))
+
+    def __len__(self):
+        return len(self._order)
+
+    def clear(self):
+        self._data.clear()
+        del self._order[:]
+        self.nbytes = 0
+
+
+class ResponseCache(object):
+    """
+    Opt-in cache of the responses to the GET requests made by the clients of
+    a Galaxy instance, for the endpoints returning large and rarely changing
+    payloads (tools, datatypes, genomes, ...). See the ``cache`` attribute of
+    :class:`~bioblend.galaxy.GalaxyInstance`.
+
+    A response is cached per URL and query parameters (except the API key)
+    for the number of seconds given in ``ttls`` for its endpoint, i.e. its
+    URL path relative to the API root (e.g. ``'tools'`` or
+    ``'datatypes/sniffers'``). Responses of the other endpoints are not
+    cached. The decoded JSON is not shared: each hit returns a new copy,
+    which the caller can safely modify.
+
+    :type ttls: dict
+    :param ttls: time to live (in seconds) of the cached responses for each
+      endpoint. Defaults to ``DEFAULT_TTLS``
+
+    :type maxsize: int
+    :param maxsize: maximum number of cached responses, the least recently
+      used ones are evicted first
+    """
+    DEFAULT_TTLS = {
+        'configuration': 300,
+        'datatypes': 3600,
+        'datatypes/edam_formats': 3600,
+        'datatypes/sniffers': 3600,
+        'genomes': 3600,
+        'tool_data': 300,
+        'tools': 300,
+    }
+
+    def __init__(self, ttls=None, maxsize=128):
+        if maxsize < 1:
+            raise ValueError("Cache size must be >= 1 (got: %s)" % maxsize)
+        self.ttls = dict(self.DEFAULT_TTLS if ttls is None else ttls)
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # key -> (expiry time, response body)
+        self._entries = _LRUDict(maxsize)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(endpoint, params):
+        return (endpoint, _params_key(params))
+
+    def get(self, endpoint, params=None):
+        """
+        Return the cached body of the response for ``endpoint`` and
+        ``params``, or ``None`` if not cached (or expired).
+        """
+        if endpoint not in self.ttls:
+            return None
+        key = self._key(endpoint, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, endpoint, params, content):
+        """
+        Cache the body of the response for ``endpoint`` and ``params``, if
+        responses for ``endpoint`` are cached.
+        """
+        ttl = self.ttls.get(endpoint)
+        if ttl is None:
+            return
+        key = self._key(endpoint, params)
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, content)
+
+    def invalidate(self, endpoint=None):
+        """
+        Drop the cached responses for ``endpoint`` and the endpoints below it
+        (e.g. ``'datatypes'`` also drops ``'datatypes/sniffers'``), or all
+        the cached responses if ``endpoint`` is ``None``.
+        """
+        with self._lock:
+            if endpoint is None:
+                self._entries.clear()
+                return
+            for key in list(self._entries):
+                if key[0] == endpoint or key[0].startswith(endpoint + '/'):
+                    del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return "ResponseCache(maxsize=%r, size=%r, hits=%r, misses=%r)" % (
+            self.maxsize, len(self), self.hits, self.misses)
+
+
+class ConditionalGetCache(object):
+    """
+    Opt-in store of the validators (``ETag`` and ``Last-Modified`` headers)
+    and bodies of the responses to the GET requests made by the clients of a
+    Galaxy instance, used to make conditional requests. See the
+    ``conditional_get`` attribute of :class:`~bioblend.galaxy.GalaxyInstance`.
+
+    When a response for the same URL and query parameters (except the API
+    key) was received with validators, the next request sends them in the
+    ``If-None-Match`` and ``If-Modified-Since`` headers, and a ``304 Not
+    Modified`` answer is served from the stored body without transferring it
+    again. Each hit returns a newly decoded copy, which the caller can safely
+    modify.
+
+    :type maxsize: int
+    :param maxsize: maximum number of stored responses, the least recently
+      used ones are evicted first
+
+    :type maxbytes: int
+    :param maxbytes: maximum total size (in bytes) of the stored response
+      bodies, the least recently used ones are evicted first. Larger
+      responses are not stored. ``None`` for no limit
+    """
+    def __init__(self, maxsize=256, maxbytes=64 * 1024 * 1024):
+        if maxsize < 1:
+            raise ValueError("Cache size must be >= 1 (got: %s)" % maxsize)
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        # Number of requests answered with 304 Not Modified
+        self.hits = 0
+        # url key -> (request headers, response body)
+        self._entries = _LRUDict(maxsize, maxbytes=maxbytes,
+                                 sizeof=lambda entry: len(entry[1]))
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None):
+        """
+        Return the headers making the request for ``url`` and ``params``
+        conditional and the stored response body, or ``None`` if there is no
+        stored response.
+        """
+        with self._lock:
+            return self._entries.get((url, _params_key(params)))
+
+    def put(self, url, params, r):
+        """
+        Store the validators and body of the response ``r`` to the request
+        for ``url`` and ``params``, if it has validators.
+        """
+        headers = {}
+        if r.headers.get('ETag'):
+            headers['If-None-Match'] = r.headers['ETag']
+        if r.headers.get('Last-Modified'):
+            headers['If-Modified-Since'] = r.headers['Last-Modified']
+        key = (url, _params_key(params))
+        with self._lock:
+            self._entries.pop(key)
+            if headers and (self.maxbytes is None or len(r.content) <= self.maxbytes):
+                self._entries[key] = (headers, r.content)
+
+    def not_modified(self, url, params=None):
+        """
+        Record a ``304 Not Modified`` answer to the conditional request for
+        ``url`` and ``params``.
+        """
+        key = (url, _params_key(params))
+        with self._lock:
+            # mark the entry as recently used
+            self._entries.get(key)
+            self.hits += 1
+
+    def clear(self):
+        """
+        Drop all the stored responses.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return "ConditionalGetCache(maxsize=%r, maxbytes=%r, size=%r, hits=%r)" % (
+            self.maxsize, self.maxbytes, len(self), self.hits)
+
+
 class Client(object):
 
-    # Class variables that configure GET request retries.  Note that since these
-    # are class variables their values are shared by all Client instances --
-    # i.e., HistoryClient, WorkflowClient, etc.
+    # Class variables that configure the default GET request retries for
+    # Galaxy instances created afterwards. Each instance can then be configured
+    # independently through its ``retry_policy`` attribute.
     #
     # Number of attempts before giving up on a GET request.
     _max_get_retries = 1
@@ -52,17 +414,22 @@ class Client(object):
     @classmethod
     def max_get_retries(cls):
         """
-        The maximum number of attempts for a GET request.
+        The default maximum number of attempts for a GET request.
         """
         return cls._max_get_retries
 
     @classmethod
     def set_max_get_retries(cls, value):
         """
-        Set the maximum number of attempts for GET requests. A value greater
-        than one causes failed GET requests to be retried `value` - 1 times.
+        Set the default maximum number of attempts for GET requests. A value
+        greater than one causes failed GET requests to be retried `value` - 1
+        times.
 
         Default: 1
+
+        .. deprecated:: 0.5.4
+            This only affects Galaxy instances created afterwards, set
+            ``max_attempts`` on the ``retry_policy`` of an instance instead.
         """
         if value < 1:
             raise ValueError("Number of retries must be >= 1 (got: %s)" % value)
@@ -72,7 +439,7 @@ class Client(object):
     @classmethod
     def get_retry_delay(cls):
         """
-        The delay (in seconds) to wait before retrying a failed GET
+        The default delay (in seconds) to wait before retrying a failed GET
         request.
         """
         return cls._get_retry_delay
@@ -80,8 +447,12 @@ class Client(object):
     @classmethod
     def set_get_retry_delay(cls, value):
         """
-        Set the delay (in seconds) to wait before retrying a failed GET
-        request. Default: 1
+        Set the default delay (in seconds) to wait before retrying a failed
+        GET request. Default: 10
+
+        .. deprecated:: 0.5.4
+            This only affects Galaxy instances created afterwards, set
+            ``retry_delay`` on the ``retry_policy`` of an instance instead.
         """
         if value < 0:
             raise ValueError("Retry delay must be >= 0 (got: %s)" % value)
@@ -101,34 +472,61 @@ class Client(object):
         self.url = '/'.join([self.gi.url, self.module])
 
     def _get(self, id=None, deleted=False, contents=None, url=None,
-             params=None, json=True):
+             params=None, json=True, stream=False):
         """
         Do a GET request, composing the URL from ``id``, ``deleted`` and
         ``contents``.  Alternatively, an explicit ``url`` can be provided.
         If ``json`` is set to ``True``, return a decoded JSON object
         (and treat an empty or undecodable response as an error).
+        If ``stream`` is set to ``True``, return the response without
+        reading its body (``json`` is then ignored).
+
+        The request will optionally be retried as configured by the
+        ``retry_policy`` of the Galaxy instance: this offers some resilience
+        in the presence of temporary failures. The delay between retries
+        starts at ``retry_policy.retry_delay`` and grows exponentially (with
+        some jitter).
 
-        The request will optionally be retried as configured by
-        ``max_get_retries`` and ``get_retry_delay``: this offers some
-        resilience in the presence of temporary failures.
+        Responses are served from the ``cache`` of the Galaxy instance, and
+        requests made conditional as configured by its ``conditional_get``,
+        if enabled.
         """
         if not url:
             url = self.gi._make_url(self, module_id=id, deleted=deleted,
                                     contents=contents)
-        attempts_left = self.max_get_retries()
-        retry_delay = self.get_retry_delay()
+        json = json and not stream
+        cache = self.gi.cache
+        endpoint = None
+        if json and cache is not None and url.startswith(self.gi.url + '/'):
+            endpoint = url[len(self.gi.url) + 1:]
+            content = cache.get(endpoint, params)
+            if content is not None:
+                return self.gi.json_codec.loads(content)
+        conditional = self.gi.conditional_get if json else None
+        validated = conditional.get(url, params) if conditional is not None else None
+        headers = dict(validated[0]) if validated is not None else None
+        policy = self.gi.retry_policy
+        attempts_left = policy.attempts('GET')
         bb.log.debug("GET - attempts left: %s; retry delay: %s",
-                     attempts_left, retry_delay)
+                     attempts_left, policy.retry_delay)
+        delays = iter(policy.backoff())
         msg = ''
         while attempts_left > 0:
             attempts_left -= 1
+            status_code = None
             try:
-                r = self.gi.make_get_request(url, params=params)
-            except (requests.exceptions.ConnectionError, ProtocolError) as e:
+                if headers:
+                    r = self.gi.make_get_request(url, params=params, headers=headers)
+                elif stream:
+                    r = self.gi.make_get_request(url, params=params, stream=True)
+                else:
+                    r = self.gi.make_get_request(url, params=params)
+            except CONNECTION_EXCEPTIONS as e:
                 msg = str(e)
             else:
                 if r is None:
                     msg = "GET: no response"
+                status_code = r.status_code
                 if r.status_code == 200:
                     if not json:
                         return r
@@ -136,21 +534,118 @@ class Client(object):
                         msg = "GET: empty response"
                     else:
                         try:
-                            return r.json()
+                            res = self.gi.json_codec.loads(r.content)
                         except ValueError:
                             msg = "GET: invalid JSON : %r" % (r.content,)
+                        else:
+                            if endpoint is not None:
+                                cache.put(endpoint, params, r.content)
+                            if conditional is not None:
+                                conditional.put(url, params, r)
+                            return res
+                elif r.status_code == 304 and validated is not None:
+                    conditional.not_modified(url, params)
+                    if endpoint is not None:
+                        cache.put(endpoint, params, validated[1])
+                    return self.gi.json_codec.loads(validated[1])
                 else:
                     msg = "GET: error %s: %r" % (r.status_code, r.content)
             msg = "%s, %d attempts left" % (msg, attempts_left)
             if attempts_left <= 0:
                 bb.log.error(msg)
-                raise ConnectionError(msg)
+                raise ConnectionError(msg, status_code=status_code)
             else:
                 bb.log.warn(msg)
-                time.sleep(retry_delay)
+                time.sleep(next(delays))
+
+    def _iter_get(self, id=None, deleted=False, contents=None, url=None,
+                  params=None):
+        """
+        Do a streamed GET request (see :meth:`_get` for the arguments) for
+        a JSON list, and iterate over its elements as they are parsed from
+        the response, instead of waiting for the whole response and keeping
+        it in memory.
+
+        The request is only made when iteration starts. Failures once the
+        response has started to arrive are not retried.
+        """
+        r = self._get(id=id, deleted=deleted, contents=contents, url=url,
+                      params=params, stream=True)
+        try:
+            for item in iter_json_array(r.iter_content(STREAM_CHUNK_SIZE)):
+                yield item
+        except ValueError as e:
+            raise ConnectionError("GET: invalid JSON : %s" % e)
+        except CONNECTION_EXCEPTIONS + (requests.exceptions.ChunkedEncodingError,) as e:
+            raise ConnectionError("GET: %s" % e)
+        finally:
+            r.close()
+
+    def _get_by_id(self, show, **attrs):
+        """
+        Return a list containing the entity returned by ``show()`` (e.g. a
+        ``show_*`` method for a given id) if its values for the keys in
+        ``attrs`` (when present) match, or an empty list if it does not match
+        or does not exist.
+
+        Used by the ``get_*`` methods to look up an id with a single request
+        instead of fetching and scanning the whole list.
+        """
+        try:
+            item = show()
+        except ConnectionError as e:
+            if e.status_code in (400, 403, 404):
+                return []
+            raise
+        if any(k in item and item[k] != v for k, v in attrs.items()):
+            return []
+        return [item]
+
+    def show_many(self, ids, show=None, max_workers=None, **kwargs):
+        """
+        Get details of several entities at once, sending the requests
+        concurrently over a bounded pool of threads.
+
+        :type ids: list
+        :param ids: Encoded IDs of the entities to show. If ``show`` takes
+          more than one positional argument (e.g.
+          :meth:`~bioblend.galaxy.histories.HistoryClient.show_dataset`),
+          each item must be a tuple of arguments.
+
+        :type show: str or callable
+        :param show: Name of the method of this client used to show each
+          entity (e.g. ``'show_dataset'``) or, if ``None`` (the default),
+          GET ``<base_url>/api/<module>/<id>`` like ``show_job`` or
+          ``show_workflow`` do. Additional keyword arguments are passed to
+          this method or, for the default, sent as query parameters.
+
+        :type max_workers: int
+        :param max_workers: Maximum number of requests in flight at the same
+          time. Defaults to the size of the Galaxy instance connection pool.
+
+        :rtype: list
+        :return: The details of each entity, in the same order as ``ids``. If
+          showing an entity fails, the exception raised (usually a
+          :class:`ConnectionError`) takes its place in the list, so that a
+          single failure does not abort the whole batch.
+        """
+        if show is None:
+            def show_f(id_):
+                return self._get(id=id_, params=dict(kwargs) if kwargs else None)
+        else:
+            meth = getattr(self, show) if isinstance(show, six.string_types) else show
+
+            def show_f(args):
+                if not isinstance(args, tuple):
+                    args = (args,)
+                return meth(*args, **kwargs)
+        if max_workers is None:
+            max_workers = self.gi.pool_maxsize
+        return concurrent_map(show_f, ids, max_workers=max_workers,
+                              return_exceptions=True)
 
     def _post(self, payload, id=None, deleted=False, contents=None, url=None,
-              files_attached=False):
+              files_attached=False, **kwargs):
         """
         Do a generic POST request, composing the url from the contents of the
         arguments. Alternatively, an explicit ``url`` can be provided to use
@@ -162,13 +657,16 @@ class Client(object):
         If ``files_attached`` is set to ``False``, the request body will be
         JSON-encoded; otherwise, it will be encoded as multipart/form-data.
 
+        Other keyword arguments (e.g. ``progress``) are passed to
+        ``make_post_request``.
+
         The return value will contain the response body as a JSON object.
         """
         if not url:
             url = self.gi._make_url(self, module_id=id, deleted=deleted,
                                     contents=contents)
         return self.gi.make_post_request(url, payload=payload,
-                                         files_attached=files_attached)
+                                         files_attached=files_attached, **kwargs)
 
     def _put(self, payload, id=None, url=None, params=None):
         """
@@ -193,11 +691,12 @@ class Client(object):
         if not url:
             url = self.gi._make_url(self, module_id=id, deleted=deleted,
                                     contents=contents)
-        payload = json.dumps(payload)
+        payload = self.gi.json_codec.dumps(payload)
         r = self.gi.make_delete_request(url, payload=payload)
         if r.status_code == 200:
-            return r.json()
+            return self.gi.json_codec.loads(r.content)
         # @see self.body for HTTP response body
         raise ConnectionError(
-            "Unexpected HTTP status code: %s" % r.status_code, body=r.text
+            "Unexpected HTTP status code: %s" % r.status_code, body=r.text,
+            status_code=r.status_code
         )
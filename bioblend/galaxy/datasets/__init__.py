@@ -1,17 +1,18 @@
 """
 Contains possible interactions with the Galaxy Datasets
 """
+import hashlib
+import json
 import logging
 import os
 import shlex
-import time
 
-import requests
-from six.moves import range
 from six.moves.urllib.parse import urljoin
 from six.moves.urllib.request import urlopen
 
+import bioblend
 from bioblend.galaxy.client import Client
+from bioblend.util import Backoff, concurrent_map, wait_for
 
 log = logging.getLogger(__name__)
 
@@ -42,7 +43,8 @@ class DatasetClient(Client):
         return Client._get(self, id=dataset_id, deleted=deleted, params=params)
 
     def download_dataset(self, dataset_id, file_path=None, use_default_filename=True,
-                         wait_for_completion=False, maxwait=12000):
+                         wait_for_completion=False, maxwait=12000,
+                         chunk_size=bioblend.CHUNK_SIZE, segments=1):
         """
         Downloads the dataset identified by 'id'.
 
@@ -52,9 +54,12 @@ class DatasetClient(Client):
         :type file_path: str
         :param file_path: If the file_path argument is provided, the dataset will be streamed to disk
                           at that path (Should not contain filename if use_default_name=True).
+                          The data is first written to a ``.part`` file next to the final one: if
+                          the download is interrupted, calling this method again resumes it from the
+                          last byte written, provided that the server supports HTTP range requests.
                           If the file_path argument is not provided, the dataset content is loaded into memory
                           and returned by the method (Memory consumption may be heavy as the entire file
-                          will be in memory).
+                          will be in memory, see :meth:`stream_dataset` for an alternative).
 
         :type use_default_filename: bool
         :param use_default_filename: If the use_default_name parameter is True, the exported
@@ -71,9 +76,116 @@ class DatasetClient(Client):
         :param maxwait: Time (in seconds) to wait for dataset to complete.
                         If the dataset state is not complete within this time, a DatasetTimeoutException will be thrown.
 
+        :type chunk_size: int
+        :param chunk_size: When streaming to disk, how many bytes at a time should be read into memory
+
+        :type segments: int
+        :param segments: When streaming to disk, download large datasets as up to this number of
+                         byte ranges fetched concurrently over separate connections, which can be
+                         faster than a single stream. Ignored if the server does not support range
+                         requests or if resuming a previous download.
+
         :rtype: dict
         :return: If a file_path argument is not provided, returns a dict containing the file_content.
-                 Otherwise returns nothing.
+                 Otherwise returns the local path of the downloaded file.
+        """
+        dataset, file_ext, url = self._get_download_url(
+            dataset_id, wait_for_completion=wait_for_completion, maxwait=maxwait)
+
+        if file_path is None:
+            r = self.gi.session.get(url, verify=self.gi.verify)
+            return r.content
+
+        # Don't use self.gi.make_get_request as currently the download API does
+        # not require a key
+        r = self.gi.session.get(url, verify=self.gi.verify, stream=True)
+        try:
+            r.raise_for_status()
+            if use_default_filename:
+                try:
+                    # First try to get the filename from the response headers
+                    # We expect tokens 'filename' '=' to be followed by the quoted filename
+                    tokens = [x for x in shlex.shlex(r.headers['content-disposition'], posix=True)]
+                    header_filepath = tokens[tokens.index('filename') + 2]
+                    filename = os.path.basename(header_filepath)
+                except (KeyError, ValueError, IndexError):
+                    # If the filename was not in the header, build a useable filename ourselves.
+                    filename = dataset['name'] + '.' + file_ext
+
+                file_local_path = os.path.join(file_path, filename)
+            else:
+                file_local_path = file_path
+
+            self._download_to_path(dataset, url, file_local_path, chunk_size=chunk_size,
+                                   segments=segments, r=r)
+        finally:
+            r.close()
+
+        # Return location file was saved to
+        return file_local_path
+
+    def _download_to_path(self, dataset, url, file_local_path, chunk_size=bioblend.CHUNK_SIZE,
+                          segments=1, r=None):
+        """
+        Download ``dataset`` from ``url`` to ``file_local_path``. See
+        :meth:`download_dataset` for the other parameters.
+        """
+        # Download to a temporary file, which is kept if the download
+        # fails so that a later call can resume it
+        part_path = file_local_path + '.part'
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if r is None and offset == 0:
+            r = self.gi.session.get(url, verify=self.gi.verify, stream=True)
+        # No expected_size: with ``to_ext``, composite datasets are served as
+        # an archive whose size is not the ``file_size`` of the primary file,
+        # so only the Content-Length sent by the server can be checked
+        # Not opened in append mode, where segmented downloads could not
+        # write at their own positions
+        with open(part_path, 'r+b' if offset else 'w+b') as fp:
+            fp.seek(offset)
+            self.gi._download(url, fp, chunk_size=chunk_size, offset=offset,
+                              r=r, segments=segments)
+        if os.path.exists(file_local_path):
+            os.remove(file_local_path)
+        os.rename(part_path, file_local_path)
+
+    def stream_dataset(self, dataset_id, chunk_size=bioblend.CHUNK_SIZE,
+                       wait_for_completion=False, maxwait=12000):
+        """
+        Open the dataset identified by 'id' for reading and return an
+        iterator over its contents, so that it can be processed without
+        loading it entirely into memory.
+
+        :type dataset_id: str
+        :param dataset_id: Encoded dataset ID
+
+        :type chunk_size: int
+        :param chunk_size: how many bytes at a time should be read into memory
+
+        See :meth:`download_dataset` for the other parameters.
+
+        :rtype: iterator of bytes
+        :return: the chunks of the dataset content. The connection is released
+                 when the iteration ends or the iterator is closed.
+        """
+        url = self._get_download_url(
+            dataset_id, wait_for_completion=wait_for_completion, maxwait=maxwait)[2]
+        r = self.gi.session.get(url, verify=self.gi.verify, stream=True)
+        r.raise_for_status()
+        return self._iter_response(r, chunk_size)
+
+    @staticmethod
+    def _iter_response(r, chunk_size):
+        try:
+            for chunk in r.iter_content(chunk_size):
+                yield chunk
+        finally:
+            r.close()
+
+    def _get_download_url(self, dataset_id, wait_for_completion=False, maxwait=12000):
+        """
+        Check that the dataset is ready and return its details, its file
+        extension and the URL to download it.
         """
         if wait_for_completion:
             self._block_until_dataset_ready(dataset_id, maxwait=maxwait)
@@ -81,7 +193,13 @@ class DatasetClient(Client):
         dataset = self.show_dataset(dataset_id)
         if not dataset['state'] == 'ok':
             raise DatasetStateException("Dataset not ready. Dataset id: %s, current state: %s" % (dataset_id, dataset['state']))
+        return (dataset,) + self._make_download_url(dataset)
 
+    def _make_download_url(self, dataset):
+        """
+        Return the file extension and the download URL of a dataset, given
+        its details.
+        """
         # Galaxy release_13.01 and earlier does not have file_ext in the dataset
         # dict, so resort to data_type.
         # N.B.: data_type cannot be used for Galaxy release_14.10 and later
@@ -99,36 +217,73 @@ class DatasetClient(Client):
         else:
             # This is Galaxy release_15.01 or earlier, for which the preferred
             # URL does not work without a key, so resort to the old URL
-            download_url = 'datasets/' + dataset_id + '/display?to_ext=' + file_ext
-        url = urljoin(self.gi.base_url, download_url)
+            download_url = 'datasets/' + dataset['id'] + '/display?to_ext=' + file_ext
+        return file_ext, urljoin(self.gi.base_url, download_url)
 
-        # Don't use self.gi.make_get_request as currently the download API does
-        # not require a key
-        r = requests.get(url, verify=self.gi.verify)
+    def _download_many(self, datasets, file_path, download, name_template='{name}',
+                       skip_existing=True, max_workers=None, manifest=None):
+        """
+        Download several datasets concurrently to the ``file_path``
+        directory, see
+        :meth:`~bioblend.galaxy.histories.HistoryClient.download_history_datasets`
+        for the parameters.
 
-        if file_path is None:
-            return r.content
-        else:
-            if use_default_filename:
-                try:
-                    # First try to get the filename from the response headers
-                    # We expect tokens 'filename' '=' to be followed by the quoted filename
-                    tokens = [x for x in shlex.shlex(r.headers['content-disposition'], posix=True)]
-                    header_filepath = tokens[tokens.index('filename') + 2]
-                    filename = os.path.basename(header_filepath)
-                except (ValueError, IndexError):
-                    # If the filename was not in the header, build a useable filename ourselves.
-                    filename = dataset['name'] + '.' + file_ext
+        :type datasets: list of dict
+        :param datasets: details of the datasets to download
 
-                file_local_path = os.path.join(file_path, filename)
+        :type download: callable
+        :param download: function called with the details of a dataset and
+          the local path where to save it
+        """
+        if not os.path.isdir(file_path):
+            os.makedirs(file_path)
+        entries = []
+        paths = set()
+        for dataset in datasets:
+            try:
+                filename = name_template.format(**dataset)
+            except (KeyError, IndexError):
+                # e.g. a dataset whose details could not be fetched
+                filename = dataset['id']
+            filename = os.path.basename(filename.replace('/', '_').replace(os.sep, '_'))
+            if filename in ('', os.curdir, os.pardir):
+                # Not usable as a file name in file_path
+                filename = dataset['id']
+            if filename in paths:
+                # Keep the local names unique
+                filename = '%s_%s' % (filename, dataset['id'])
+            paths.add(filename)
+            entries.append({
+                'id': dataset['id'],
+                'name': dataset.get('name'),
+                'file_size': dataset.get('file_size'),
+                'path': os.path.join(file_path, filename),
+            })
+
+        def download_entry(args):
+            dataset, entry = args
+            if dataset.get('state', 'ok') != 'ok':
+                raise DatasetStateException("Dataset not ready. Dataset id: %s, current state: %s" % (dataset['id'], dataset['state']))
+            if skip_existing and _file_matches(entry['path'], dataset):
+                return 'skipped'
+            download(dataset, entry['path'])
+            return 'downloaded'
+
+        if max_workers is None:
+            max_workers = self.gi.pool_maxsize
+        results = concurrent_map(download_entry, list(zip(datasets, entries)),
+                                 max_workers=max_workers, return_exceptions=True)
+        for entry, res in zip(entries, results):
+            if isinstance(res, Exception):
+                log.warn("Failed to download dataset %s: %s" % (entry['id'], res))
+                entry['status'] = 'failed'
+                entry['error'] = str(res)
             else:
-                file_local_path = file_path
-
-            with open(file_local_path, 'wb') as fp:
-                fp.write(r.content)
-
-            # Return location file was saved to
-            return file_local_path
+                entry['status'] = res
+        if manifest is not None:
+            with open(os.path.join(file_path, manifest), 'w') as f:
+                json.dump(entries, f, indent=2)
+        return entries
 
     def _is_dataset_complete(self, dataset_id):
         dataset = self.show_dataset(dataset_id)
@@ -144,11 +299,13 @@ class DatasetClient(Client):
         assert maxwait > interval
         assert interval > 0
 
-        for time_left in range(maxwait, 0, -interval):
-            if self._is_dataset_complete(dataset_id):
-                return
-            log.warn("Waiting for dataset %s to complete. Will wait another %is" % (dataset_id, time_left))
-            time.sleep(interval)
+        def on_wait(delay):
+            log.warn("Waiting for dataset %s to complete. Will check again in %.1fs" % (dataset_id, delay))
+
+        # Poll often at first, then back off up to ``interval`` seconds
+        backoff = Backoff(initial_delay=min(1, interval), max_delay=interval, timeout=maxwait)
+        if wait_for(lambda: self._is_dataset_complete(dataset_id), backoff, on_wait=on_wait):
+            return
         if raise_on_timeout:
             # noinspection PyUnboundLocalVariable
             raise DatasetTimeoutException("Waited too long for dataset to complete: %s" % dataset_id)
@@ -174,6 +331,27 @@ class DatasetClient(Client):
         return res.read()
 
 
+def _file_matches(path, dataset):
+    """
+    Check whether the local file at ``path`` is a complete copy of
+    ``dataset``, comparing its size and, if Galaxy has computed one, its
+    checksum.
+    """
+    if not os.path.isfile(path) or os.path.getsize(path) != dataset.get('file_size'):
+        return False
+    for dataset_hash in dataset.get('hashes') or []:
+        try:
+            h = hashlib.new(dataset_hash['hash_function'].replace('-', '').lower())
+        except ValueError:
+            # Unsupported hash function
+            continue
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(bioblend.CHUNK_SIZE), b''):
+                h.update(chunk)
+        return h.hexdigest() == dataset_hash['hash_value']
+    return True
+
+
 class DatasetStateException(Exception):
     def __init__(self, value):
         self.value = value
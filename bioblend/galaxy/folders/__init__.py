@@ -39,4 +39,7 @@ class FoldersClient(Client):
         :rtype:     dict
         """
         payload = {'undelete': undelete}
-        return Client._delete(self, payload, id=folder_id)
+        res = Client._delete(self, payload, id=folder_id)
+        # The library of the folder is unknown, drop all the folder indexes
+        self.gi.libraries._invalidate_folder_index()
+        return res
@@ -8,13 +8,19 @@ import time
 import six
 
 import bioblend
-from bioblend.galaxy.client import Client
+from bioblend.galaxy.client import Client, ConnectionError
+from bioblend.util import Backoff
+
+# Default number of items fetched by each request of iter_history_contents()
+HISTORY_CONTENTS_PAGE_SIZE = 500
 
 
 class HistoryClient(Client):
 
     def __init__(self, galaxy_instance):
         self.module = 'histories'
+        # Whether the server filters histories by name, None if unknown yet
+        self._name_filter_supported = None
         super(HistoryClient, self).__init__(galaxy_instance)
 
     def create_history(self, name=None):
@@ -51,14 +57,31 @@ class HistoryClient(Client):
         :return: Return a list of history element dicts. If more than one
                  history matches the given ``name``, return the list of all the
                  histories with the given name.
+
+        .. note::
+          A ``history_id`` is looked up directly (returning the details of
+          the history) and a ``name`` is filtered by the server if supported,
+          instead of fetching all the histories.
         """
         if history_id is not None and name is not None:
             raise ValueError('Provide only one argument between name or history_id, but not both')
-        histories = Client._get(self, deleted=deleted)
         if history_id is not None:
-            history = next((_ for _ in histories if _['id'] == history_id), None)
-            histories = [history] if history is not None else []
-        elif name is not None:
+            return self._get_by_id(lambda: self.show_history(history_id), deleted=deleted)
+        if name is not None and self._name_filter_supported is not False:
+            try:
+                histories = Client._get(self, deleted=deleted, params={'q': 'name', 'qv': name})
+            except ConnectionError as e:
+                if e.status_code != 400:
+                    raise
+                self._name_filter_supported = False
+                histories = Client._get(self, deleted=deleted)
+            else:
+                if self._name_filter_supported is None and histories:
+                    # Older servers ignore the filter
+                    self._name_filter_supported = all(_['name'] == name for _ in histories)
+        else:
+            histories = Client._get(self, deleted=deleted)
+        if name is not None:
             histories = [_ for _ in histories if _['name'] == name]
         return histories
 
@@ -86,8 +109,9 @@ class HistoryClient(Client):
         :param details: Used when contents=True, includes dataset details. Set
           to 'all' for the most information
 
-        :type types: str
-        :param types: ???
+        :type types: list of str
+        :param types: Used when contents=True, includes only items of these
+          types (``dataset``, ``dataset_collection``)
         """
         params = {}
         if contents:
@@ -98,9 +122,88 @@ class HistoryClient(Client):
             if visible is not None:
                 params['visible'] = visible
             if types is not None:
-                params['types'] = types.join(",")
+                params['types'] = ",".join(types)
         return Client._get(self, id=history_id, contents=contents, params=params)
 
+    def iter_history_contents(self, history_id, deleted=None, visible=None, types=None,
+                              details=None, limit=HISTORY_CONTENTS_PAGE_SIZE):
+        """
+        Iterate over the contents of a history, fetching them from Galaxy in
+        pages of ``limit`` items (ordered by hid) instead of in a single
+        response, which is slow and memory hungry for large histories. Each
+        item is yielded as soon as it has been received.
+
+        :type history_id: str
+        :param history_id: Encoded history ID
+
+        :type deleted: bool
+        :param deleted: if set, only return deleted (``True``) or non-deleted
+          (``False``) items
+
+        :type visible: bool
+        :param visible: if set, only return visible (``True``) or hidden
+          (``False``) items
+
+        :type types: list of str
+        :param types: if set, only return items of these types
+          (``dataset``, ``dataset_collection``)
+
+        :type details: str
+        :param details: set to 'all' to get the full details of each item
+
+        :type limit: int
+        :param limit: number of items fetched by each request
+
+        :rtype: generator of dict
+        :return: the items of the history contents, as returned by
+          :meth:`show_history` with ``contents=True``
+
+        .. note::
+          Galaxy servers which do not support pagination return all the
+          contents in the first response; the filters are then applied
+          client side.
+        """
+        if limit < 1:
+            raise ValueError("limit must be >= 1 (got: %s)" % limit)
+        filters = []
+        if deleted is not None:
+            filters.append(('deleted', deleted))
+        if visible is not None:
+            filters.append(('visible', visible))
+        if types is not None and len(types) == 1:
+            filters.append(('history_content_type', types[0]))
+        params = {'v': 'dev', 'order': 'hid-asc', 'limit': limit,
+                  'q': [_[0] for _ in filters], 'qv': [_[1] for _ in filters]}
+        if details:
+            params['details'] = details
+            params['view'] = 'detailed'
+        offset = 0
+        first_id = None
+        while True:
+            params['offset'] = offset
+            count = 0
+            # Each page is streamed, so that items are yielded as they arrive
+            for item in Client._iter_get(self, id=history_id, contents=True, params=params):
+                if count == 0 and offset:
+                    if item.get('id') == first_id:
+                        # The offset was ignored
+                        return
+                elif count == 0:
+                    first_id = item.get('id')
+                count += 1
+                if deleted is not None and item.get('deleted') != deleted:
+                    continue
+                if visible is not None and item.get('visible') != visible:
+                    continue
+                if types is not None and item.get('history_content_type') not in types:
+                    continue
+                yield item
+            if count != limit:
+                # Either the last page, or the whole list from a server
+                # which does not support pagination
+                return
+            offset += limit
+
     def delete_dataset(self, history_id, dataset_id):
         """
         Mark corresponding dataset as deleted.
@@ -361,7 +464,8 @@ class HistoryClient(Client):
         return Client._post(self, payload, id=history_id, contents=True)
 
     def download_dataset(self, history_id, dataset_id, file_path,
-                         use_default_filename=True, to_ext=None):
+                         use_default_filename=True, to_ext=None,
+                         chunk_size=bioblend.CHUNK_SIZE):
         """
         Download a ``dataset_id`` from history with ``history_id`` to a
         file on the local file system, saving it to ``file_path``.
@@ -378,7 +482,78 @@ class HistoryClient(Client):
             file_local_path = file_path
         return self.gi.datasets.download_dataset(dataset_id,
                                                  file_path=file_local_path,
-                                                 use_default_filename=False)
+                                                 use_default_filename=False,
+                                                 chunk_size=chunk_size)
+
+    def download_history_datasets(self, history_id, file_path, name_template='{hid}_{name}',
+                                  include_hidden=False, include_deleted=False,
+                                  skip_existing=True, max_workers=None, manifest=None,
+                                  chunk_size=bioblend.CHUNK_SIZE, segments=1):
+        """
+        Download all the datasets of a history to a directory. The history
+        contents are listed with a single request, then the datasets are
+        downloaded concurrently.
+
+        :type history_id: str
+        :param history_id: Encoded history ID
+
+        :type file_path: str
+        :param file_path: directory where to save the datasets, created if
+          it does not exist
+
+        :type name_template: str
+        :param name_template: template for the local file names, formatted
+          (with ``str.format()``) with the dataset details, e.g. ``{hid}``,
+          ``{name}``, ``{id}`` or ``{file_ext}``. Slashes are replaced with
+          underscores and, if two datasets get the same file name, the
+          dataset ID is appended to the second one
+
+        :type include_hidden: bool
+        :param include_hidden: whether to also download hidden datasets
+
+        :type include_deleted: bool
+        :param include_deleted: whether to also download deleted datasets
+
+        :type skip_existing: bool
+        :param skip_existing: do not download again a dataset if a file with
+          the same size (and checksum, if computed by Galaxy) already exists
+          at its local path
+
+        :type max_workers: int
+        :param max_workers: maximum number of concurrent downloads, defaults
+          to the size of the Galaxy instance connection pool
+
+        :type manifest: str
+        :param manifest: if not ``None``, also save the returned list as JSON
+          to a file with this name in ``file_path``
+
+        See :meth:`~bioblend.galaxy.datasets.DatasetClient.download_dataset`
+        for the other parameters.
+
+        :rtype: list of dict
+        :return: one entry per dataset with its ``id``, ``name``,
+          ``file_size``, local ``path`` and ``status`` (``'downloaded'``,
+          ``'skipped'`` or ``'failed'``, in which case ``error`` describes the
+          failure). Failed downloads do not stop the others.
+        """
+        contents = self.show_history(history_id, contents=True, details='all',
+                                     deleted=None if include_deleted else False,
+                                     visible=None if include_hidden else True)
+        datasets = [
+            _ for _ in contents
+            if _.get('history_content_type', 'dataset') == 'dataset'
+            if include_deleted or not _.get('deleted')
+            if include_hidden or _.get('visible', True)]
+        dataset_client = self.gi.datasets
+
+        def download(dataset, file_local_path):
+            url = dataset_client._make_download_url(dataset)[1]
+            dataset_client._download_to_path(dataset, url, file_local_path,
+                                             chunk_size=chunk_size, segments=segments)
+
+        return dataset_client._download_many(
+            datasets, file_path, download, name_template=name_template,
+            skip_existing=skip_existing, max_workers=max_workers, manifest=manifest)
 
     def delete_history(self, history_id, purge=False):
         """
@@ -486,12 +661,13 @@ class HistoryClient(Client):
             'include_deleted': include_deleted,
         }
         url = '%s/exports' % self.gi._make_url(self, history_id)
+        delays = iter(Backoff(initial_delay=1, max_delay=30))
         while True:
             r = Client._put(self, {}, url=url, params=params)
             if not wait or r.status_code == 200:
                 break
-            time.sleep(1)
-        contents = r.json()
+            time.sleep(next(delays))
+        contents = self.gi.json_codec.loads(r.content)
         if contents:
             jeha_id = contents['download_url'].rsplit('/', 1)[-1]
         else:
@@ -520,6 +696,6 @@ class HistoryClient(Client):
         url = '%s/exports/%s' % (
             self.gi._make_url(self, module_id=history_id), jeha_id)
         r = self.gi.make_get_request(url, stream=True)
-        r.raise_for_status()
-        for chunk in r.iter_content(chunk_size):
-            outf.write(chunk)
+        # Resume the download if interrupted
+        self.gi._download(url, outf, chunk_size=chunk_size, r=r,
+                          params=self.gi.default_params)
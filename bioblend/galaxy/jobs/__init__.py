@@ -46,6 +46,17 @@ class JobsClient(Client):
         """
         return Client._get(self)
 
+    def iter_jobs(self):
+        """
+        Iterate over the jobs for current user, yielding each one as soon as
+        it has been received instead of waiting for the whole list.
+
+        :rtype: generator of dict
+        :return: the summary information of each job, as returned by
+          :meth:`get_jobs`
+        """
+        return Client._iter_get(self)
+
     def show_job(self, job_id):
         """
         Display information on a single job from current user
@@ -1,6 +1,7 @@
 """
 Contains possible interactions with the Galaxy Data Libraries
 """
+import bioblend
 from bioblend.galaxy.client import Client
 from bioblend.util import attach_file
 
@@ -9,6 +10,10 @@ class LibraryClient(Client):
 
     def __init__(self, galaxy_instance):
         self.module = 'libraries'
+        # Root folder ids of the libraries, which never change
+        self._root_folder_ids = {}
+        # Library contents items of the folders of the libraries, by path
+        self._folder_indexes = {}
         super(LibraryClient, self).__init__(galaxy_instance)
 
     def create_library(self, name, description=None, synopsis=None):
@@ -52,7 +57,10 @@ class LibraryClient(Client):
             the library will be permanently deleted.
         """
         payload = {}
-        return Client._delete(self, payload, id=library_id)
+        res = Client._delete(self, payload, id=library_id)
+        self._root_folder_ids.pop(library_id, None)
+        self._invalidate_folder_index(library_id)
+        return res
 
     def __show_item(self, library_id, item_id):
         """
@@ -118,20 +126,59 @@ class LibraryClient(Client):
 
     def _get_root_folder_id(self, library_id):
         """
-        Find the root folder (i.e. '/') of a library.
+        Find the root folder (i.e. '/') of a library. The result is
+        remembered, since the root folder of a library never changes.
 
         :type library_id: str
         :param library_id: library id to find root of
         """
+        if library_id in self._root_folder_ids:
+            return self._root_folder_ids[library_id]
         l = self.show_library(library_id=library_id)
         if 'root_folder_id' in l:
-            return l['root_folder_id']
-        # Galaxy previous to release_13.04 does not have root_folder_id in
-        # library dictionary, so resort to find the folder with name '/'
+            root_folder_id = l['root_folder_id']
+        else:
+            # Galaxy previous to release_13.04 does not have root_folder_id in
+            # library dictionary, so resort to find the folder with name '/'
+            root = self._get_folder_index(library_id).get('/')
+            if root is None:
+                return None
+            root_folder_id = root['id']
+        self._root_folder_ids[library_id] = root_folder_id
+        return root_folder_id
+
+    def _get_folder_index(self, library_id, refresh=False):
+        """
+        Return a dict mapping the paths of the folders of a library to their
+        library contents items. The library contents are only fetched the
+        first time (or if ``refresh`` is ``True``), the folders created
+        through this client are then added to the index.
+        """
+        index = None if refresh else self._folder_indexes.get(library_id)
+        if index is None:
+            self._fetch_folders(library_id)
+            index = self._folder_indexes[library_id]
+        return index
+
+    def _fetch_folders(self, library_id):
+        """
+        Return the folders of a library, in the order of the library
+        contents, and index them by path.
+        """
         library_contents = self.show_library(library_id=library_id, contents=True)
-        for f in library_contents:
-            if f['name'] == '/':
-                return f['id']
+        folders = [_ for _ in library_contents if _['type'] == 'folder']
+        self._folder_indexes[library_id] = dict((_['name'], _) for _ in folders)
+        return folders
+
+    def _invalidate_folder_index(self, library_id=None):
+        """
+        Drop the folder index of a library, or of all the libraries if
+        ``library_id`` is ``None``, so that it is fetched again when needed.
+        """
+        if library_id is None:
+            self._folder_indexes.clear()
+        else:
+            self._folder_indexes.pop(library_id, None)
 
     def create_folder(self, library_id, folder_name, description=None, base_folder_id=None):
         """
@@ -160,7 +207,16 @@ class LibraryClient(Client):
         payload['create_type'] = 'folder'
         if description is not None:
             payload['description'] = description
-        return Client._post(self, payload, id=library_id, contents=True)
+        res = Client._post(self, payload, id=library_id, contents=True)
+        index = self._folder_indexes.get(library_id)
+        if index is not None:
+            base_path = next((path for path, f in index.items() if f['id'] == base_folder_id), None)
+            if base_path is not None and isinstance(res, list) and res:
+                path = base_path.rstrip('/') + '/' + res[0]['name']
+                index[path] = dict(res[0], name=path, type='folder')
+            else:
+                self._invalidate_folder_index(library_id)
+        return res
 
     def get_folders(self, library_id, folder_id=None, name=None):
         """
@@ -178,18 +234,29 @@ class LibraryClient(Client):
 
         :rtype: dict
         :return: list of dicts each containing basic information about a folder.
+
+        .. note::
+          Lookups by ``name`` or ``folder_id`` use an index of the folders of
+          the library, built from the library contents on the first lookup
+          and fetched again only when a folder is not found in it. Folders
+          deleted or renamed by other means may then still be returned: call
+          this method without ``name`` and ``folder_id`` to refresh the
+          index.
         """
         if folder_id is not None and name is not None:
             raise ValueError('Provide only one argument between name or folder_id, but not both')
-        library_contents = self.show_library(library_id=library_id, contents=True)
-        if folder_id is not None:
-            folder = next((_ for _ in library_contents if _['type'] == 'folder' and _['id'] == folder_id), None)
-            folders = [folder] if folder is not None else []
-        elif name is not None:
-            folders = [_ for _ in library_contents if _['type'] == 'folder' and _['name'] == name]
-        else:
-            folders = [_ for _ in library_contents if _['type'] == 'folder']
-        return folders
+        if folder_id is None and name is None:
+            return self._fetch_folders(library_id)
+
+        def lookup(index):
+            if name is not None:
+                return index.get(name)
+            return next((_ for _ in index.values() if _['id'] == folder_id), None)
+        folder = lookup(self._get_folder_index(library_id))
+        if folder is None:
+            # The folder may have been created by other means
+            folder = lookup(self._get_folder_index(library_id, refresh=True))
+        return [folder] if folder is not None else []
 
     def get_libraries(self, library_id=None, name=None, deleted=False):
         """
@@ -210,13 +277,17 @@ class LibraryClient(Client):
 
         :rtype: dict
         :return: list of dicts each containing basic information about a library.
+
+        .. note::
+          A ``library_id`` is looked up directly (returning the details of
+          the library) instead of fetching all the libraries.
         """
         if library_id is not None and name is not None:
             raise ValueError('Provide only one argument between name or library_id, but not both')
-        libraries = Client._get(self, deleted=deleted)
         if library_id is not None:
-            library = next((_ for _ in libraries if _['id'] == library_id), None)
-            libraries = [library] if library is not None else []
+            return self._get_by_id(
+                lambda: Client._get(self, id=library_id, deleted=deleted), deleted=deleted)
+        libraries = Client._get(self, deleted=deleted)
         if name is not None:
             libraries = [_ for _ in libraries if _['name'] == name]
         return libraries
@@ -236,6 +307,20 @@ class LibraryClient(Client):
         """
         return Client._get(self, id=library_id, contents=contents)
 
+    def iter_library_contents(self, library_id):
+        """
+        Iterate over the contents of a library, yielding each item as soon as
+        it has been received instead of waiting for the whole list.
+
+        :type library_id: str
+        :param library_id: Encoded library ID
+
+        :rtype: generator of dict
+        :return: the folders and datasets of the library, as returned by
+          :meth:`show_library` with ``contents=True``
+        """
+        return Client._iter_get(self, id=library_id, contents=True)
+
     def _do_upload(self, library_id, **keywords):
         """
         Set up the POST request and do the actual data upload to a data library.
@@ -274,9 +359,13 @@ class LibraryClient(Client):
             payload["upload_option"] = "upload_paths"
             payload["filesystem_paths"] = keywords["filesystem_paths"]
 
+        post_kwargs = {}
+        if files_attached:
+            post_kwargs = dict((k, keywords[k]) for k in ('chunk_size', 'progress')
+                               if keywords.get(k) is not None)
         try:
             return Client._post(self, payload, id=library_id, contents=True,
-                                files_attached=files_attached)
+                                files_attached=files_attached, **post_kwargs)
         finally:
             if payload.get('files_0|file_data', None) is not None:
                 payload['files_0|file_data'].close()
@@ -330,7 +419,8 @@ class LibraryClient(Client):
                                dbkey=dbkey)
 
     def upload_file_from_local_path(self, library_id, file_local_path,
-                                    folder_id=None, file_type='auto', dbkey='?'):
+                                    folder_id=None, file_type='auto', dbkey='?',
+                                    chunk_size=bioblend.CHUNK_SIZE, progress=None):
         """
         Read local file contents from file_local_path and upload data to a
         library.
@@ -350,10 +440,20 @@ class LibraryClient(Client):
 
         :type dbkey: str
         :param dbkey: Dbkey
+
+        :type chunk_size: int
+        :param chunk_size: how many bytes of the file at a time should be read
+          into memory and sent
+
+        :type progress: callable
+        :param progress: function called with a
+          :class:`~bioblend.util.TransferProgress` (bytes sent, total size,
+          throughput and ETA) after each chunk is sent
         """
         return self._do_upload(library_id, file_local_path=file_local_path,
                                folder_id=folder_id, file_type=file_type,
-                               dbkey=dbkey)
+                               dbkey=dbkey, chunk_size=chunk_size,
+                               progress=progress)
 
     def upload_file_from_server(self, library_id, server_dir, folder_id=None,
                                 file_type='auto', dbkey='?', link_data_only=None,
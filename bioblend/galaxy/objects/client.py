@@ -6,11 +6,11 @@ via their handles in :class:`~.galaxy_instance.GalaxyInstance`.
 """
 import abc
 import collections
-import json
 
 import six
 
 import bioblend
+from bioblend.util import concurrent_map
 from . import wrappers
 
 
@@ -75,21 +75,48 @@ class ObjClient(object):
         except (TypeError, IndexError):
             self._error('%s: unexpected reply: %r' % (meth_name, reply))
 
+    def _map(self, func, items, max_workers=None, return_exceptions=False):
+        """
+        Apply ``func`` to each item concurrently, by default with as many
+        workers as the connections kept alive by the Galaxy instance. See
+        :func:`~bioblend.util.concurrent_map` for ``return_exceptions``.
+        """
+        if max_workers is None:
+            max_workers = self.gi.pool_maxsize
+        return concurrent_map(func, items, max_workers=max_workers,
+                              return_exceptions=return_exceptions)
+
 
 class ObjDatasetClient(ObjClient):
 
-    def _get_container(self, id_, ctype):
+    def _get_container(self, id_, ctype, lazy=False):
         show_fname = 'show_%s' % ctype.__name__.lower()
         gi_client = getattr(self.gi, ctype.API_MODULE)
         show_f = getattr(gi_client, show_fname)
         res = show_f(id_)
         cdict = self._get_dict(show_fname, res)
         cdict['id'] = id_  # overwrite unencoded id
-        c_infos = show_f(id_, contents=True)
+        if lazy:
+            container = ctype(wrappers._owned(cdict), gi=self.obj_gi)
+            # contents will be fetched on first access to content_infos
+            object.__setattr__(container, '_content_infos', None)
+            return container
+        c_infos = self._get_content_infos(id_, ctype)
+        return ctype(wrappers._owned(cdict), content_infos=c_infos, gi=self.obj_gi)
+
+    def _get_content_infos(self, id_, ctype):
+        show_fname = 'show_%s' % ctype.__name__.lower()
+        gi_client = getattr(self.gi, ctype.API_MODULE)
+        c_infos = getattr(gi_client, show_fname)(id_, contents=True)
         if not isinstance(c_infos, collections.Sequence):
             self._error('%s: unexpected reply: %r' % (show_fname, c_infos))
-        c_infos = [ctype.CONTENT_INFO_TYPE(_) for _ in c_infos]
-        return ctype(cdict, content_infos=c_infos, gi=self.obj_gi)
+        return [ctype.CONTENT_INFO_TYPE(wrappers._owned(_)) for _ in c_infos]
+
+    def _get_containers(self, ids, ctype, max_workers=None, lazy=False):
+        def get(id_):
+            return self.obj_gi._lookup(
+                ctype, id_, lambda: self._get_container(id_, ctype, lazy=lazy))
+        return self._map(get, ids, max_workers=max_workers)
 
 
 class ObjLibraryClient(ObjDatasetClient):
@@ -117,13 +144,14 @@ class ObjLibraryClient(ObjDatasetClient):
         :rtype: :class:`~.wrappers.Library`
         :return: the library corresponding to ``id_``
         """
-        return self._get_container(id_, wrappers.Library)
+        return self.obj_gi._lookup(
+            wrappers.Library, id_, lambda: self._get_container(id_, wrappers.Library))
 
     def get_previews(self, name=None, deleted=False):
         dicts = self.gi.libraries.get_libraries(name=name, deleted=deleted)
-        return [wrappers.LibraryPreview(_, gi=self.obj_gi) for _ in dicts]
+        return [wrappers.LibraryPreview(wrappers._owned(_), gi=self.obj_gi) for _ in dicts]
 
-    def list(self, name=None, deleted=False):
+    def list(self, name=None, deleted=False, max_workers=None, lazy=False):
         """
         Get libraries owned by the user of this Galaxy instance.
 
@@ -131,6 +159,12 @@ class ObjLibraryClient(ObjDatasetClient):
         :param name: return only libraries with this name
         :type deleted: bool
         :param deleted: if ``True``, return libraries that have been deleted
+        :type max_workers: int
+        :param max_workers: maximum number of libraries to fetch concurrently
+          (default: the size of the Galaxy instance connection pool)
+        :type lazy: bool
+        :param lazy: if ``True``, the contents of each library are only
+          fetched on first access to its ``content_infos``
 
         :rtype: list of :class:`~.wrappers.Library`
         """
@@ -139,9 +173,11 @@ class ObjLibraryClient(ObjDatasetClient):
             # return Library objects only for not-deleted libraries since Galaxy
             # does not filter them out and Galaxy release_14.08 and earlier
             # crashes when trying to get a deleted library
-            return [self.get(_['id']) for _ in dicts if not _['deleted']]
+            ids = [_['id'] for _ in dicts if not _['deleted']]
         else:
-            return [self.get(_['id']) for _ in dicts]
+            ids = [_['id'] for _ in dicts]
+        return self._get_containers(ids, wrappers.Library,
+                                    max_workers=max_workers, lazy=lazy)
 
     def delete(self, id_=None, name=None):
         """
@@ -157,6 +193,7 @@ class ObjLibraryClient(ObjDatasetClient):
             res = self.gi.libraries.delete_library(id_)
             if not isinstance(res, collections.Mapping):
                 self._error('delete_library: unexpected reply: %r' % (res,))
+            self.obj_gi._forget(wrappers.Library, id_)
 
 
 class ObjHistoryClient(ObjDatasetClient):
@@ -185,13 +222,14 @@ class ObjHistoryClient(ObjDatasetClient):
         :rtype: :class:`~.wrappers.History`
         :return: the history corresponding to ``id_``
         """
-        return self._get_container(id_, wrappers.History)
+        return self.obj_gi._lookup(
+            wrappers.History, id_, lambda: self._get_container(id_, wrappers.History))
 
     def get_previews(self, name=None, deleted=False):
         dicts = self.gi.histories.get_histories(name=name, deleted=deleted)
-        return [wrappers.HistoryPreview(_, gi=self.obj_gi) for _ in dicts]
+        return [wrappers.HistoryPreview(wrappers._owned(_), gi=self.obj_gi) for _ in dicts]
 
-    def list(self, name=None, deleted=False):
+    def list(self, name=None, deleted=False, max_workers=None, lazy=False):
         """
         Get histories owned by the user of this Galaxy instance.
 
@@ -199,11 +237,18 @@ class ObjHistoryClient(ObjDatasetClient):
         :param name: return only histories with this name
         :type deleted: bool
         :param deleted: if ``True``, return histories that have been deleted
+        :type max_workers: int
+        :param max_workers: maximum number of histories to fetch concurrently
+          (default: the size of the Galaxy instance connection pool)
+        :type lazy: bool
+        :param lazy: if ``True``, the contents of each history are only
+          fetched on first access to its ``content_infos``
 
         :rtype: list of :class:`~.wrappers.History`
         """
         dicts = self.gi.histories.get_histories(name=name, deleted=deleted)
-        return [self.get(_['id']) for _ in dicts]
+        return self._get_containers([_['id'] for _ in dicts], wrappers.History,
+                                    max_workers=max_workers, lazy=lazy)
 
     def delete(self, id_=None, name=None, purge=False):
         """
@@ -223,6 +268,7 @@ class ObjHistoryClient(ObjDatasetClient):
             res = self.gi.histories.delete_history(id_, purge=purge)
             if not isinstance(res, collections.Mapping):
                 self._error('delete_history: unexpected reply: %r' % (res,))
+            self.obj_gi._forget(wrappers.History, id_)
 
 
 class ObjWorkflowClient(ObjClient):
@@ -249,7 +295,7 @@ class ObjWorkflowClient(ObjClient):
             wf_dict = src
         else:
             try:
-                wf_dict = json.loads(src)
+                wf_dict = self.gi.json_codec.loads(src)
             except (TypeError, ValueError):
                 self._error('src not supported: %r' % (src,))
         wf_info = self.gi.workflows.import_workflow_json(wf_dict)
@@ -275,17 +321,19 @@ class ObjWorkflowClient(ObjClient):
         :rtype: :class:`~.wrappers.Workflow`
         :return: the workflow corresponding to ``id_``
         """
-        res = self.gi.workflows.show_workflow(id_)
-        wf_dict = self._get_dict('show_workflow', res)
-        return wrappers.Workflow(wf_dict, gi=self.obj_gi)
+        def fetch():
+            res = self.gi.workflows.show_workflow(id_)
+            wf_dict = self._get_dict('show_workflow', res)
+            return wrappers.Workflow(wrappers._owned(wf_dict), gi=self.obj_gi)
+        return self.obj_gi._lookup(wrappers.Workflow, id_, fetch)
 
     # the 'deleted' option is not available for workflows
     def get_previews(self, name=None, published=False):
         dicts = self.gi.workflows.get_workflows(name=name, published=published)
-        return [wrappers.WorkflowPreview(_, gi=self.obj_gi) for _ in dicts]
+        return [wrappers.WorkflowPreview(wrappers._owned(_), gi=self.obj_gi) for _ in dicts]
 
     # the 'deleted' option is not available for workflows
-    def list(self, name=None, deleted=False, published=False):
+    def list(self, name=None, deleted=False, published=False, max_workers=None):
         """
         Get workflows owned by the user of this Galaxy instance.
 
@@ -296,11 +344,15 @@ class ObjWorkflowClient(ObjClient):
           removed in BioBlend 0.6
         :type published: bool
         :param published: if ``True``, return also published workflows
+        :type max_workers: int
+        :param max_workers: maximum number of workflows to fetch concurrently
+          (default: the size of the Galaxy instance connection pool)
 
         :rtype: list of :class:`~.wrappers.Workflow`
         """
         dicts = self.gi.workflows.get_workflows(name=name, published=published)
-        return [self.get(_['id']) for _ in dicts]
+        return self._map(self.get, [_['id'] for _ in dicts],
+                         max_workers=max_workers)
 
     def delete(self, id_=None, name=None):
         """
@@ -316,6 +368,7 @@ class ObjWorkflowClient(ObjClient):
             res = self.gi.workflows.delete_workflow(id_)
             if not isinstance(res, six.string_types):
                 self._error('delete_workflow: unexpected reply: %r' % (res,))
+            self.obj_gi._forget(wrappers.Workflow, id_)
 
 
 class ObjToolClient(ObjClient):
@@ -332,9 +385,11 @@ class ObjToolClient(ObjClient):
         :rtype: :class:`~.wrappers.Tool`
         :return: the tool corresponding to ``id_``
         """
-        res = self.gi.tools.show_tool(id_)
-        tool_dict = self._get_dict('show_tool', res)
-        return wrappers.Tool(tool_dict, gi=self.obj_gi)
+        def fetch():
+            res = self.gi.tools.show_tool(id_)
+            tool_dict = self._get_dict('show_tool', res)
+            return wrappers.Tool(wrappers._owned(tool_dict), gi=self.obj_gi)
+        return self.obj_gi._lookup(wrappers.Tool, id_, fetch)
 
     def get_previews(self, name=None, trackster=None):
         """
@@ -350,7 +405,7 @@ class ObjToolClient(ObjClient):
         :rtype: list of :class:`~.wrappers.Tool`
         """
         dicts = self.gi.tools.get_tools(name=name, trackster=trackster)
-        return [wrappers.Tool(_, gi=self.obj_gi) for _ in dicts]
+        return [wrappers.Tool(wrappers._owned(_), gi=self.obj_gi) for _ in dicts]
 
     # the 'deleted' option is not available for tools
     def list(self, name=None, trackster=None):
@@ -2,18 +2,25 @@
 A representation of a Galaxy instance based on oo wrappers.
 """
 
+import threading
 import time
 
+import six
+
 import bioblend
 import bioblend.galaxy
+from bioblend.util import Backoff
 
-from . import client
+from . import client, wrappers
 
 
 # dataset states corresponding to a 'pending' condition
 _PENDING_DS_STATES = set(
     ["new", "upload", "queued", "running", "setting_metadata"]
 )
+# above this number of datasets, ask for the details of all history contents
+# rather than passing a (too long) list of ids in the query string
+_MAX_DETAILS_IDS = 100
 
 
 def _get_error_info(hda):
@@ -26,6 +33,78 @@ def _get_error_info(hda):
     return msg
 
 
+class IdentityMap(object):
+    """
+    Map of the wrappers retrieved through a :class:`GalaxyInstance`, keyed by
+    wrapper type and id, so that retrieving the same entity again returns the
+    same live wrapper without contacting Galaxy. See the ``identity_map``
+    attribute of :class:`GalaxyInstance`.
+
+    Wrappers are not updated by changes made outside of them: call their
+    ``refresh()`` method, or set a ``ttl``.
+
+    :type ttl: float
+    :param ttl: if set, a wrapper retrieved more than ``ttl`` seconds ago is
+      refreshed (in place, if it has a ``refresh()`` method) on the next
+      retrieval
+    """
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # (wrapper type, id) -> (wrapper, retrieval time)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, type_, id_, fetch):
+        """
+        Return the wrapper of type ``type_`` for ``id_``, calling ``fetch()``
+        to retrieve it from Galaxy if not in the map (or stale).
+        """
+        key = (type_, id_)
+        with self._lock:
+            entry = self._entries.get(key)
+            fresh = entry is not None and (
+                self.ttl is None or time.time() - entry[1] <= self.ttl)
+            if fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if fresh:
+            return entry[0]
+        if entry is not None and hasattr(entry[0], 'refresh'):
+            obj = entry[0].refresh()
+        else:
+            obj = fetch()
+        with self._lock:
+            if entry is None:
+                # keep the first wrapper stored by a concurrent retrieval
+                obj = self._entries.get(key, (obj, None))[0]
+            self._entries[key] = (obj, time.time())
+        return obj
+
+    def forget(self, type_, id_):
+        """
+        Remove the wrapper of type ``type_`` for ``id_`` from the map.
+        """
+        with self._lock:
+            self._entries.pop((type_, id_), None)
+
+    def clear(self):
+        """
+        Remove all the wrappers from the map.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return "IdentityMap(ttl=%r, size=%r, hits=%r, misses=%r)" % (
+            self.ttl, len(self), self.hits, self.misses)
+
+
 class GalaxyInstance(object):
     """
     A representation of an instance of Galaxy, identified by a URL and
@@ -39,6 +118,13 @@ class GalaxyInstance(object):
     :param api_key: user's API key for the given instance of Galaxy, obtained
       from the Galaxy web UI.
 
+    :type identity_map: :class:`IdentityMap` or bool
+    :param identity_map: if set, the histories, libraries, workflows, tools,
+      datasets and folders retrieved by id are kept in this map (a new one
+      with the default settings if ``True``), so that retrieving them again
+      returns the same wrapper without contacting Galaxy. Disabled by
+      default. The map is available as the ``identity_map`` attribute.
+
     This is actually a factory class which instantiates the entity-specific
     clients.
 
@@ -48,9 +134,10 @@ class GalaxyInstance(object):
       gi = GalaxyInstance('http://127.0.0.1:8080', 'foo')
       histories = gi.histories.list()
     """
-    def __init__(self, url, api_key=None, email=None, password=None):
+    def __init__(self, url, api_key=None, email=None, password=None, identity_map=None):
         self.gi = bioblend.galaxy.GalaxyInstance(url, api_key, email, password)
         self.log = bioblend.log
+        self.identity_map = IdentityMap() if identity_map is True else identity_map
         self.__histories = client.ObjHistoryClient(self)
         self.__libraries = client.ObjLibraryClient(self)
         self.__workflows = client.ObjWorkflowClient(self)
@@ -84,6 +171,23 @@ class GalaxyInstance(object):
         """
         return self.__tools
 
+    def _lookup(self, type_, id_, fetch):
+        """
+        Return the wrapper of type ``type_`` for ``id_`` from the identity
+        map if enabled, otherwise from ``fetch()``.
+        """
+        if self.identity_map is None:
+            return fetch()
+        return self.identity_map.get(type_, id_, fetch)
+
+    def _forget(self, type_, id_):
+        """
+        Remove the wrapper of type ``type_`` for ``id_`` from the identity
+        map, if enabled.
+        """
+        if self.identity_map is not None:
+            self.identity_map.forget(type_, id_)
+
     def _wait_datasets(self, datasets, polling_interval, break_on_error=True):
         """
         Wait for datasets to come out of the pending states.
@@ -93,7 +197,8 @@ class GalaxyInstance(object):
         :param datasets: datasets
 
         :type polling_interval: float
-        :param polling_interval: polling interval in seconds
+        :param polling_interval: maximum polling interval in seconds (polls
+          start more frequently and back off up to this interval)
 
         :type break_on_error: bool
         :param break_on_error: if ``True``, raise a RuntimeError exception as
@@ -108,8 +213,8 @@ class GalaxyInstance(object):
         """
         def poll(ds_list):
             pending = []
+            self._refresh_datasets(ds_list)
             for ds in ds_list:
-                ds.refresh()
                 self.log.info('{0.id}: {0.state}'.format(ds))
                 if break_on_error and ds.state == 'error':
                     raise RuntimeError(_get_error_info(ds))
@@ -118,6 +223,43 @@ class GalaxyInstance(object):
             return pending
 
         self.log.info('waiting for datasets')
+        # poll often at first, then back off up to polling_interval seconds
+        delays = iter(Backoff(initial_delay=min(1, polling_interval),
+                              max_delay=polling_interval))
+        datasets = poll(datasets)
         while datasets:
+            time.sleep(next(delays))
             datasets = poll(datasets)
-            time.sleep(polling_interval)
+
+    def _refresh_datasets(self, datasets):
+        """
+        Refresh the given datasets.
+
+        History datasets are refreshed from a single contents request per
+        history, instead of one ``show_dataset`` request per dataset.
+        Library datasets and datasets for which Galaxy does not return
+        details (release_15.01 and earlier) are refreshed individually.
+        """
+        by_history = {}
+        others = []
+        for ds in datasets:
+            if isinstance(ds, wrappers.HistoryDatasetAssociation):
+                by_history.setdefault(ds.container.id, []).append(ds)
+            else:
+                others.append(ds)
+        for hist_id, hdas in six.iteritems(by_history):
+            if len(hdas) > _MAX_DETAILS_IDS:
+                details = 'all'
+            else:
+                details = ','.join(_.id for _ in hdas)
+            contents = self.gi.histories.show_history(
+                hist_id, contents=True, details=details)
+            # summary dicts lack most dataset attributes, use only detailed ones
+            ds_dicts = dict((_['id'], _) for _ in contents if 'file_size' in _)
+            for ds in hdas:
+                if ds.id in ds_dicts:
+                    ds.__init__(wrappers._owned(ds_dicts[ds.id]), ds.container, ds.gi)
+                else:
+                    others.append(ds)
+        for ds in others:
+            ds.refresh()
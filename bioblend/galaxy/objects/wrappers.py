@@ -7,11 +7,16 @@ A basic object-oriented interface for Galaxy entities.
 import abc
 import collections
 import json
+import os
+import threading
+import time
 
 from six.moves import http_client
 import six
 
 import bioblend
+from bioblend.galaxy.histories import HISTORY_CONTENTS_PAGE_SIZE
+from bioblend.util import default_json_codec
 
 __all__ = [
     'Wrapper',
@@ -36,6 +41,34 @@ __all__ = [
 ]
 
 
+class _Owned(object):
+    """
+    Marks a dictionary freshly decoded from a Galaxy API response (or
+    otherwise not shared with user code), so that the wrapper built from it
+    takes ownership of it instead of making a defensive copy.
+    """
+    __slots__ = ('wrapped',)
+
+    def __init__(self, wrapped):
+        self.wrapped = wrapped
+
+
+def _owned(wrapped):
+    """
+    Return ``wrapped`` marked as owned by the wrapper built from it, see
+    :class:`_Owned`.
+    """
+    return _Owned(wrapped)
+
+
+def _json_codec(gi):
+    """
+    Return the JSON codec of the GalaxyInstance ``gi``, or the default one if
+    ``gi`` is ``None``.
+    """
+    return gi.gi.json_codec if gi is not None else default_json_codec
+
+
 @six.add_metaclass(abc.ABCMeta)
 class Wrapper(object):
     """
@@ -51,6 +84,8 @@ class Wrapper(object):
     attribute.
     """
     BASE_ATTRS = ('id', 'name')
+    # Subclasses which do not declare __slots__ get a __dict__ as usual
+    __slots__ = ()
 
     @abc.abstractmethod
     def __init__(self, wrapped, parent=None, gi=None):
@@ -64,19 +99,37 @@ class Wrapper(object):
         :type gi: :class:`GalaxyInstance`
         :param gi: the GalaxyInstance through which we can access this wrapper
         """
+        wrapped = self._take(wrapped)
+        object.__setattr__(self, 'wrapped', wrapped)
+        for k in self.BASE_ATTRS:
+            object.__setattr__(self, k, self.wrapped.get(k))
+        object.__setattr__(self, '_cached_parent', parent)
+        object.__setattr__(self, 'is_modified', False)
+        object.__setattr__(self, 'gi', gi)
+
+    @staticmethod
+    def _take(wrapped):
+        """
+        Return the dictionary to be wrapped: ``wrapped`` itself if owned
+        (see :class:`_Owned`), otherwise a copy of it.
+        """
+        if isinstance(wrapped, _Owned):
+            # freshly decoded from the API: no need for a defensive copy
+            wrapped = wrapped.wrapped
+            if not isinstance(wrapped, collections.Mapping):
+                raise TypeError('wrapped object must be a mapping type')
+            return wrapped
         if not isinstance(wrapped, collections.Mapping):
             raise TypeError('wrapped object must be a mapping type')
-        # loads(dumps(x)) is a bit faster than deepcopy and allows type checks
+        # loads(dumps(x)) is a bit faster than deepcopy and allows type checks.
+        # Always the standard json module: faster libraries may serialize
+        # values which are not JSON (e.g. orjson with datetime) or change
+        # numbers (e.g. ujson with big integers)
         try:
             dumped = json.dumps(wrapped)
         except (TypeError, ValueError):
             raise ValueError('wrapped object must be JSON-serializable')
-        object.__setattr__(self, 'wrapped', json.loads(dumped))
-        for k in self.BASE_ATTRS:
-            object.__setattr__(self, k, self.wrapped.get(k))
-        object.__setattr__(self, '_cached_parent', parent)
-        object.__setattr__(self, 'is_modified', False)
-        object.__setattr__(self, 'gi', gi)
+        return json.loads(dumped)
 
     @abc.abstractproperty
     def gi_module(self):
@@ -123,14 +176,14 @@ class Wrapper(object):
         """
         Return a JSON dump of this wrapper.
         """
-        return json.dumps(self.wrapped)
+        return _json_codec(self.gi).dumps(self.wrapped)
 
     @classmethod
     def from_json(cls, jdef):
         """
         Build a new wrapper from a JSON dump.
         """
-        return cls(json.loads(jdef))
+        return cls(_owned(default_json_codec.loads(jdef)))
 
     # FIXME: things like self.x[0] = 'y' do NOT call self.__setattr__
     def __setattr__(self, name, value):
@@ -161,7 +214,7 @@ class Step(Wrapper):
         super(Step, self).__init__(step_dict, parent=parent, gi=parent.gi)
         if self.type == 'tool' and self.tool_inputs:
             for k, v in six.iteritems(self.tool_inputs):
-                self.tool_inputs[k] = json.loads(v)
+                self.tool_inputs[k] = _json_codec(self.gi).loads(v)
 
     @property
     def gi_module(self):
@@ -514,16 +567,24 @@ class Dataset(Wrapper):
           are also affected: :meth:`peek`, :meth:`download` and
           :meth:`get_contents`.
         """
-        kwargs = {'stream': True}
+        r = self._open_stream()[0]
+        r.raise_for_status()
+        return r.iter_content(chunk_size)  # FIXME: client can't close r
+
+    def _open_stream(self):
+        """
+        Send a streamed GET request for the dataset contents and return the
+        response together with the query parameters used.
+        """
+        params = {}
         if isinstance(self, LibraryDataset):
-            kwargs['params'] = {'ld_ids%5B%5D': self.id}
-        r = self.gi.gi.make_get_request(self._stream_url, **kwargs)
+            params['ld_ids%5B%5D'] = self.id
+        r = self.gi.gi.make_get_request(self._stream_url, stream=True, params=params)
         if isinstance(self, LibraryDataset) and r.status_code == 500:
             # compatibility with older Galaxy releases
-            kwargs['params'] = {'ldda_ids%5B%5D': self.id}
-            r = self.gi.gi.make_get_request(self._stream_url, **kwargs)
-        r.raise_for_status()
-        return r.iter_content(chunk_size)  # FIXME: client can't close r
+            params = {'ldda_ids%5B%5D': self.id}
+            r = self.gi.gi.make_get_request(self._stream_url, stream=True, params=params)
+        return r, params
 
     def peek(self, chunk_size=bioblend.CHUNK_SIZE):
         """
@@ -536,17 +597,30 @@ class Dataset(Wrapper):
         except StopIteration:
             return b''
 
-    def download(self, file_object, chunk_size=bioblend.CHUNK_SIZE):
+    def download(self, file_object, chunk_size=bioblend.CHUNK_SIZE, segments=1):
         """
         Open dataset for reading and save its contents to ``file_object``.
 
         :type file_object: file
         :param file_object: output file object
 
+        :type segments: int
+        :param segments: if greater than 1, download a large dataset as up
+          to this number of byte ranges fetched concurrently, writing each at
+          its position in ``file_object`` (which must then be seekable). A
+          single stream is used if the server does not support range
+          requests
+
         See :meth:`.get_stream` for info on other params.
+
+        If the connection is interrupted, the download is resumed from the
+        last byte written, provided that the server supports HTTP range
+        requests.
         """
-        for chunk in self.get_stream(chunk_size=chunk_size):
-            file_object.write(chunk)
+        r, params = self._open_stream()
+        self.gi.gi._download(self._stream_url, file_object, chunk_size=chunk_size,
+                             expected_size=self.file_size, r=r,
+                             segments=segments, params=params)
 
     def get_contents(self, chunk_size=bioblend.CHUNK_SIZE):
         """
@@ -564,7 +638,7 @@ class Dataset(Wrapper):
         """
         gi_client = getattr(self.gi.gi, self.container.API_MODULE)
         ds_dict = gi_client.show_dataset(self.container.id, self.id)
-        self.__init__(ds_dict, self.container, self.gi)
+        self.__init__(_owned(ds_dict), self.container, self.gi)
         return self
 
     def wait(self, polling_interval=POLLING_INTERVAL, break_on_error=True):
@@ -614,8 +688,8 @@ class HistoryDatasetAssociation(Dataset):
         Delete this dataset.
         """
         self.gi.gi.histories.delete_dataset(self.container.id, self.id)
-        self.container.refresh()
         self.refresh()
+        self.container._track_dataset(self)
 
 
 class LibRelatedDataset(Dataset):
@@ -658,17 +732,91 @@ class LibraryDataset(LibRelatedDataset):
         """
         self.gi.gi.libraries.delete_library_dataset(
             self.container.id, self.id, purged=purged)
-        self.container.refresh()
+        self.container._forget_content(self.id)
         self.refresh()
 
 
+# Tuples of keys of the rows wrapped by _CompactWrapper instances, shared
+# among the rows of the same class with the same keys. Rows of a given class
+# have only a few distinct sets of keys: beyond _MAX_ROW_KEYS of them, the
+# tuples are not shared any more
+_ROW_KEYS = {}
+_ROW_KEYS_LOCK = threading.Lock()
+_MAX_ROW_KEYS = 32
+
+
+def _intern_row_keys(cls, keys):
+    """
+    Return the shared tuple equal to ``keys`` for rows of class ``cls``.
+    """
+    with _ROW_KEYS_LOCK:
+        cls_keys = _ROW_KEYS.setdefault(cls, {})
+        if keys in cls_keys:
+            return cls_keys[keys]
+        if len(cls_keys) < _MAX_ROW_KEYS:
+            cls_keys[keys] = keys
+        return keys
+
+
 @six.add_metaclass(abc.ABCMeta)
-class ContentInfo(Wrapper):
+class _CompactWrapper(Wrapper):
+    """
+    Abstract base class for wrappers of the rows of long listings (content
+    infos and previews), which may be held in very large numbers.
+
+    Instances have no ``__dict__``: subclasses must declare the attributes
+    they add to ``BASE_ATTRS`` in ``__slots__``. The wrapped row is stored as
+    a tuple of the values not already held by ``BASE_ATTRS``, the tuple of
+    keys being shared with the other rows with the same keys, and the
+    ``wrapped`` dictionary is only built when first accessed.
+    """
+    __slots__ = ('id', 'name', '_keys', '_row', '_cached_parent', 'is_modified', 'gi')
+
+    def __init__(self, wrapped, parent=None, gi=None):
+        wrapped = self._take(wrapped)
+        keys = tuple(wrapped)
+        object.__setattr__(self, '_keys', _intern_row_keys(self.__class__, keys))
+        object.__setattr__(self, '_row', tuple(
+            wrapped[k] for k in keys if k not in self.BASE_ATTRS))
+        for k in self.BASE_ATTRS:
+            object.__setattr__(self, k, wrapped.get(k))
+        object.__setattr__(self, '_cached_parent', parent)
+        object.__setattr__(self, 'is_modified', False)
+        object.__setattr__(self, 'gi', gi)
+
+    @property
+    def wrapped(self):
+        if isinstance(self._row, tuple):
+            values = iter(self._row)
+            # from now on, the dictionary is the reference
+            object.__setattr__(self, '_row', dict(
+                (k, getattr(self, k) if k in self.BASE_ATTRS else next(values))
+                for k in self._keys))
+        return self._row
+
+    def __setattr__(self, name, value):
+        if name not in self.wrapped:
+            raise AttributeError("can't set attribute")
+        self.wrapped[name] = value
+        # other keys have no slot, they are only stored in the dictionary
+        if name in self.BASE_ATTRS:
+            object.__setattr__(self, name, value)
+        self.touch()
+
+    def unmap(self):
+        # keep the id in the wrapped dictionary
+        self.wrapped
+        super(_CompactWrapper, self).unmap()
+
+
+@six.add_metaclass(abc.ABCMeta)
+class ContentInfo(_CompactWrapper):
     """
     Instances of this class wrap dictionaries obtained by getting
     ``/api/{histories,libraries}/<ID>/contents`` from Galaxy.
     """
     BASE_ATTRS = Wrapper.BASE_ATTRS + ('type',)
+    __slots__ = ('type',)
 
     @abc.abstractmethod
     def __init__(self, info_dict, gi=None):
@@ -680,6 +828,8 @@ class LibraryContentInfo(ContentInfo):
     Instances of this class wrap dictionaries obtained by getting
     ``/api/libraries/<ID>/contents`` from Galaxy.
     """
+    __slots__ = ()
+
     def __init__(self, info_dict, gi=None):
         super(LibraryContentInfo, self).__init__(info_dict, gi=gi)
 
@@ -694,6 +844,7 @@ class HistoryContentInfo(ContentInfo):
     ``/api/histories/<ID>/contents`` from Galaxy.
     """
     BASE_ATTRS = ContentInfo.BASE_ATTRS + ('deleted', 'state', 'visible')
+    __slots__ = ('deleted', 'state', 'visible')
 
     def __init__(self, info_dict, gi=None):
         super(HistoryContentInfo, self).__init__(info_dict, gi=gi)
@@ -709,17 +860,124 @@ class DatasetContainer(Wrapper):
     Abstract base class for dataset containers (histories and libraries).
     """
     BASE_ATTRS = Wrapper.BASE_ATTRS + ('deleted',)
+    # Default maximum age in seconds of the cached content infos, after
+    # which they are fetched again from Galaxy on access (None: never expire
+    # them)
+    CONTENT_INFOS_MAX_AGE = None
 
     @abc.abstractmethod
-    def __init__(self, c_dict, content_infos=None, gi=None):
+    def __init__(self, c_dict, content_infos=None, gi=None,
+                 content_infos_max_age=None):
         """
         :type content_infos: list of :class:`ContentInfo`
         :param content_infos: info objects for the container's contents
+
+        :type content_infos_max_age: float
+        :param content_infos_max_age: maximum age in seconds of the cached
+          content infos for this container (default:
+          ``CONTENT_INFOS_MAX_AGE``)
         """
         super(DatasetContainer, self).__init__(c_dict, gi=gi)
         if content_infos is None:
             content_infos = []
-        object.__setattr__(self, 'content_infos', content_infos)
+        self._set_content_infos(content_infos)
+        if content_infos_max_age is None:
+            content_infos_max_age = self.CONTENT_INFOS_MAX_AGE
+        self.set_content_infos_max_age(content_infos_max_age)
+
+    def set_content_infos_max_age(self, max_age):
+        """
+        Set the maximum age in seconds of the cached content infos of this
+        container, after which they are fetched again from Galaxy on access.
+        If ``None``, they never expire.
+        """
+        object.__setattr__(self, 'content_infos_max_age', max_age)
+
+    def _set_content_infos(self, content_infos):
+        object.__setattr__(self, '_content_infos', content_infos)
+        object.__setattr__(self, '_content_infos_time', time.time())
+
+    @property
+    def content_infos(self):
+        """
+        Info objects for the container's contents.
+
+        For containers retrieved in lazy mode, these are fetched from Galaxy
+        on first access. Changes made through the methods of this object
+        (e.g. uploads) are applied to the cached info objects without
+        fetching them again; call :meth:`refresh` to see changes made by
+        other means, or :meth:`set_content_infos_max_age` to fetch them
+        again when older than the given number of seconds.
+        """
+        max_age = self.content_infos_max_age
+        if self._content_infos is None or (
+                max_age is not None and time.time() - self._content_infos_time > max_age):
+            self._set_content_infos(
+                self.gi_module._get_content_infos(self.id, self.__class__))
+        return self._content_infos
+
+    def _track_content(self, info_dict):
+        """
+        Add (or replace, if already present) an item in the cached content
+        infos, instead of fetching them again from Galaxy after a change.
+        """
+        if self._content_infos is None:
+            # Not fetched yet, so it will be up to date anyway
+            return
+        info = self.CONTENT_INFO_TYPE(_owned(info_dict), gi=self.gi)
+        for i, old_info in enumerate(self._content_infos):
+            if old_info.id == info.id:
+                self._content_infos[i] = info
+                return
+        self._content_infos.append(info)
+
+    def _track_dataset(self, ds, folder_id=None):
+        """
+        Add ``ds`` to the cached content infos, see :meth:`_track_content`.
+        """
+        name = self._content_name(ds.name, folder_id)
+        if name is None:
+            # Cannot tell, fetch them again on next access
+            object.__setattr__(self, '_content_infos', None)
+            return
+        info_dict = dict((k, ds.wrapped.get(k)) for k in self.CONTENT_INFO_TYPE.BASE_ATTRS)
+        info_dict.update(name=name, type='file')
+        self._track_content(info_dict)
+
+    def _content_name(self, name, folder_id=None):
+        """
+        Return the name of a content info for an item named ``name``, or
+        ``None`` if unknown.
+        """
+        return name
+
+    def _get_new_dataset(self, ds_id, folder_id=None):
+        """
+        Retrieve a dataset just added to this container and add it to the
+        cached content infos.
+        """
+        ds = self.get_dataset(ds_id)
+        self._track_dataset(ds, folder_id=folder_id)
+        return ds
+
+    def _forget_content(self, id_):
+        """
+        Remove an item from the cached content infos.
+        """
+        if self._content_infos is not None:
+            self._content_infos[:] = [_ for _ in self._content_infos if _.id != id_]
+
+    def _refresh_metadata(self):
+        """
+        Re-fetch the attributes of this container, but not its contents.
+        """
+        gi_client = getattr(self.gi.gi, self.API_MODULE)
+        c_dict = getattr(gi_client, 'show_%s' % self.__class__.__name__.lower())(self.id)
+        content_infos, content_infos_time = self._content_infos, self._content_infos_time
+        self.__init__(_owned(c_dict), content_infos=content_infos, gi=self.gi,
+                      content_infos_max_age=self.content_infos_max_age)
+        object.__setattr__(self, '_content_infos_time', content_infos_time)
+        return self
 
     @property
     def dataset_ids(self):
@@ -746,9 +1004,11 @@ class DatasetContainer(Wrapper):
 
         Returns: self
         """
-        fresh = self.gi_module.get(self.id)
+        # bypass the identity map, which would return this same object
+        fresh = self.gi_module._get_container(self.id, self.__class__)
         self.__init__(
-            fresh.wrapped, content_infos=fresh.content_infos, gi=self.gi)
+            _owned(fresh.wrapped), content_infos=fresh.content_infos, gi=self.gi,
+            content_infos_max_age=self.content_infos_max_age)
         return self
 
     def get_dataset(self, ds_id):
@@ -762,9 +1022,11 @@ class DatasetContainer(Wrapper):
           :class:`~.LibraryDataset`
         :return: the dataset corresponding to ``ds_id``
         """
-        gi_client = getattr(self.gi.gi, self.API_MODULE)
-        ds_dict = gi_client.show_dataset(self.id, ds_id)
-        return self.DS_TYPE(ds_dict, self, gi=self.gi)
+        def fetch():
+            gi_client = getattr(self.gi.gi, self.API_MODULE)
+            ds_dict = gi_client.show_dataset(self.id, ds_id)
+            return self.DS_TYPE(_owned(ds_dict), self, gi=self.gi)
+        return self.gi._lookup(self.DS_TYPE, ds_id, fetch)
 
     def get_datasets(self, name=None):
         """
@@ -802,9 +1064,11 @@ class History(DatasetContainer):
     CONTENT_INFO_TYPE = HistoryContentInfo
     API_MODULE = 'histories'
 
-    def __init__(self, hist_dict, content_infos=None, gi=None):
+    def __init__(self, hist_dict, content_infos=None, gi=None,
+                 content_infos_max_age=None):
         super(History, self).__init__(
-            hist_dict, content_infos=content_infos, gi=gi)
+            hist_dict, content_infos=content_infos, gi=gi,
+            content_infos_max_age=content_infos_max_age)
 
     @property
     def gi_module(self):
@@ -835,7 +1099,7 @@ class History(DatasetContainer):
             self.id, name=name, annotation=annotation, **kwds)
         if res != http_client.OK:
             raise RuntimeError('failed to update history')
-        self.refresh()
+        self._refresh_metadata()
         return self
 
     def delete(self, purge=False):
@@ -871,8 +1135,7 @@ class History(DatasetContainer):
         if not isinstance(res, collections.Mapping):
             raise RuntimeError(
                 'upload_dataset_from_library: unexpected reply: %r' % res)
-        self.refresh()
-        return self.get_dataset(res['id'])
+        return self._get_new_dataset(res['id'])
 
     def upload_file(self, path, **kwargs):
         """
@@ -882,17 +1145,55 @@ class History(DatasetContainer):
         :param path: path of the file to upload
 
         See :meth:`~bioblend.galaxy.tools.ToolClient.upload_file` for
-        the optional parameters.
+        the optional parameters, e.g. ``chunked=True`` to upload a large
+        file in resumable chunks.
 
         :rtype: :class:`~.HistoryDatasetAssociation`
         :return: the uploaded dataset
         """
         out_dict = self.gi.gi.tools.upload_file(path, self.id, **kwargs)
-        self.refresh()
-        return self.get_dataset(out_dict['outputs'][0]['id'])
+        return self._get_new_dataset(out_dict['outputs'][0]['id'])
 
     upload_dataset = upload_file
 
+    def upload_files(self, paths, files_per_request=10, max_workers=None, **kwargs):
+        """
+        Upload several files to this history. The files are grouped in
+        requests of ``files_per_request`` files each, which are sent
+        concurrently.
+
+        :type paths: list of str
+        :param paths: paths of the files to upload
+
+        :type files_per_request: int
+        :param files_per_request: maximum number of files uploaded by each
+          request (i.e. each run of the upload tool)
+
+        :type max_workers: int
+        :param max_workers: maximum number of concurrent requests, defaults
+          to the size of the Galaxy instance connection pool
+
+        See :meth:`~bioblend.galaxy.tools.ToolClient.upload_files` for the
+        optional parameters.
+
+        :rtype: list of :class:`~.HistoryDatasetAssociation`
+        :return: the uploaded datasets, in the same order as ``paths``
+        """
+        if files_per_request < 1:
+            raise ValueError("files_per_request must be >= 1 (got: %s)" % files_per_request)
+        paths = list(paths)
+        batches = [paths[i:i + files_per_request]
+                   for i in range(0, len(paths), files_per_request)]
+        results = self.gi.histories._map(
+            lambda batch: self.gi.gi.tools.upload_files(batch, self.id, **kwargs),
+            batches, max_workers=max_workers)
+        # The tool outputs are the details of the new datasets
+        hdas = [HistoryDatasetAssociation(_owned(out), self, gi=self.gi)
+                for res in results for out in res['outputs']]
+        for hda in hdas:
+            self._track_dataset(hda)
+        return hdas
+
     def paste_content(self, content, **kwargs):
         """
         Upload a string to a new dataset in this history.
@@ -907,8 +1208,44 @@ class History(DatasetContainer):
         :return: the uploaded dataset
         """
         out_dict = self.gi.gi.tools.paste_content(content, self.id, **kwargs)
-        self.refresh()
-        return self.get_dataset(out_dict['outputs'][0]['id'])
+        return self._get_new_dataset(out_dict['outputs'][0]['id'])
+
+    def iter_content_infos(self, deleted=None, visible=None, types=None,
+                           page_size=HISTORY_CONTENTS_PAGE_SIZE):
+        """
+        Iterate over info objects for the contents of this history, fetching
+        them from Galaxy in pages of ``page_size`` items, without building
+        the whole list (unlike :attr:`content_infos`).
+
+        See :meth:`~bioblend.galaxy.histories.HistoryClient.iter_history_contents`
+        for the filter parameters.
+
+        :rtype: generator of :class:`~.HistoryContentInfo`
+        """
+        for c_dict in self.gi.gi.histories.iter_history_contents(
+                self.id, deleted=deleted, visible=visible, types=types, limit=page_size):
+            yield HistoryContentInfo(_owned(c_dict), gi=self.gi)
+
+    def iter_datasets(self, name=None, deleted=None, visible=None,
+                      page_size=HISTORY_CONTENTS_PAGE_SIZE):
+        """
+        Iterate over the datasets of this history, fetching their details from
+        Galaxy in pages of ``page_size`` datasets, without building the whole
+        list (unlike :meth:`get_datasets`).
+
+        :type name: str
+        :param name: return only datasets with this name
+
+        See :meth:`~bioblend.galaxy.histories.HistoryClient.iter_history_contents`
+        for the other filter parameters.
+
+        :rtype: generator of :class:`~.HistoryDatasetAssociation`
+        """
+        for ds_dict in self.gi.gi.histories.iter_history_contents(
+                self.id, deleted=deleted, visible=visible, types=['dataset'],
+                details='all', limit=page_size):
+            if name is None or ds_dict.get('name') == name:
+                yield HistoryDatasetAssociation(_owned(ds_dict), self, gi=self.gi)
 
     def export(self, gzip=True, include_hidden=False, include_deleted=False,
                wait=False):
@@ -934,6 +1271,15 @@ class History(DatasetContainer):
         return self.gi.gi.histories.download_history(
             self.id, jeha_id, outf, chunk_size=chunk_size)
 
+    def download_all(self, file_path, **kwargs):
+        """
+        Download all the datasets of this history to a directory.  See
+        :meth:`~bioblend.galaxy.histories.HistoryClient.download_history_datasets`
+        for parameter and return value info.
+        """
+        return self.gi.gi.histories.download_history_datasets(
+            self.id, file_path, **kwargs)
+
 
 class Library(DatasetContainer):
     """
@@ -944,9 +1290,11 @@ class Library(DatasetContainer):
     CONTENT_INFO_TYPE = LibraryContentInfo
     API_MODULE = 'libraries'
 
-    def __init__(self, lib_dict, content_infos=None, gi=None):
+    def __init__(self, lib_dict, content_infos=None, gi=None,
+                 content_infos_max_age=None):
         super(Library, self).__init__(
-            lib_dict, content_infos=content_infos, gi=gi)
+            lib_dict, content_infos=content_infos, gi=gi,
+            content_infos_max_age=content_infos_max_age)
 
     @property
     def gi_module(self):
@@ -959,6 +1307,45 @@ class Library(DatasetContainer):
         """
         return [_.id for _ in self.content_infos if _.type == 'folder']
 
+    def download_all(self, file_path, name_template='{name}', skip_existing=True,
+                     max_workers=None, manifest=None, chunk_size=bioblend.CHUNK_SIZE):
+        """
+        Download all the datasets of this library to a directory, fetching
+        their details and contents concurrently.  See
+        :meth:`~bioblend.galaxy.histories.HistoryClient.download_history_datasets`
+        for parameter and return value info.
+
+        Datasets whose details cannot be fetched are reported as ``'failed'``
+        like failed downloads. Unlike for histories, an interrupted download
+        is started again from scratch by a later call instead of being
+        resumed.
+        """
+        names = dict((_.id, os.path.basename(_.name)) for _ in self.content_infos
+                     if _.type == 'file')
+        ids = self.dataset_ids
+        results = self.gi.libraries._map(self.get_dataset, ids,
+                                         max_workers=max_workers, return_exceptions=True)
+        by_id = dict(zip(ids, results))
+
+        def download(ds_dict, file_local_path):
+            ds = by_id[ds_dict['id']]
+            if isinstance(ds, Exception):
+                raise ds
+            part_path = file_local_path + '.part'
+            with open(part_path, 'wb') as f:
+                ds.download(f, chunk_size=chunk_size)
+            if os.path.exists(file_local_path):
+                os.remove(file_local_path)
+            os.rename(part_path, file_local_path)
+
+        # Datasets which could not be fetched are only known by id and name
+        ds_dicts = [{'id': id_, 'name': names.get(id_, id_)} if isinstance(res, Exception)
+                    else res.wrapped for id_, res in zip(ids, results)]
+        return self.gi.gi.datasets._download_many(
+            ds_dicts, file_path, download,
+            name_template=name_template, skip_existing=skip_existing,
+            max_workers=max_workers, manifest=manifest)
+
     def delete(self):
         """
         Delete this library.
@@ -992,8 +1379,7 @@ class Library(DatasetContainer):
         fid = self.__pre_upload(folder)
         res = self.gi.gi.libraries.upload_file_contents(
             self.id, data, folder_id=fid, **kwargs)
-        self.refresh()
-        return self.get_dataset(res[0]['id'])
+        return self._get_new_dataset(res[0]['id'], folder_id=fid)
 
     def upload_from_url(self, url, folder=None, **kwargs):
         """
@@ -1007,8 +1393,7 @@ class Library(DatasetContainer):
         fid = self.__pre_upload(folder)
         res = self.gi.gi.libraries.upload_file_from_url(
             self.id, url, folder_id=fid, **kwargs)
-        self.refresh()
-        return self.get_dataset(res[0]['id'])
+        return self._get_new_dataset(res[0]['id'], folder_id=fid)
 
     def upload_from_local(self, path, folder=None, **kwargs):
         """
@@ -1022,8 +1407,39 @@ class Library(DatasetContainer):
         fid = self.__pre_upload(folder)
         res = self.gi.gi.libraries.upload_file_from_local_path(
             self.id, path, folder_id=fid, **kwargs)
-        self.refresh()
-        return self.get_dataset(res[0]['id'])
+        return self._get_new_dataset(res[0]['id'], folder_id=fid)
+
+    def upload_files(self, paths, folder=None, max_workers=None, **kwargs):
+        """
+        Upload several local files to this library, sending the requests
+        concurrently.
+
+        :type paths: list of str
+        :param paths: local paths of the files to upload
+
+        :type max_workers: int
+        :param max_workers: maximum number of concurrent requests, defaults
+          to the size of the Galaxy instance connection pool
+
+        :rtype: list of :class:`~.LibraryDataset`
+        :return: the uploaded datasets, in the same order as ``paths``
+
+        See :meth:`.upload_data` for info on other params.
+        """
+        fid = self.__pre_upload(folder)
+        upload_fid = fid
+        if upload_fid is None:
+            upload_fid = self.gi.gi.libraries._get_root_folder_id(self.id)
+        results = self.gi.libraries._map(
+            lambda path: self.gi.gi.libraries.upload_file_from_local_path(
+                self.id, path, folder_id=upload_fid, **kwargs),
+            paths, max_workers=max_workers)
+        datasets = self.gi.libraries._map(
+            self.get_dataset, [res[0]['id'] for res in results],
+            max_workers=max_workers)
+        for ds in datasets:
+            self._track_dataset(ds, folder_id=fid)
+        return datasets
 
     def upload_from_galaxy_fs(self, paths, folder=None, link_data_only=None, **kwargs):
         """
@@ -1060,9 +1476,8 @@ class Library(DatasetContainer):
             raise RuntimeError(
                 'upload_from_galaxy_filesystem: unexpected reply: %r' % res)
         new_datasets = [
-            self.get_dataset(ds_info['id']) for ds_info in res
+            self._get_new_dataset(ds_info['id'], folder_id=fid) for ds_info in res
         ]
-        self.refresh()
         return new_datasets
 
     def copy_from_dataset(self, hda, folder=None, message=''):
@@ -1077,8 +1492,7 @@ class Library(DatasetContainer):
         fid = self.__pre_upload(folder)
         res = self.gi.gi.libraries.copy_from_dataset(
             self.id, hda.id, folder_id=fid, message=message)
-        self.refresh()
-        return self.get_dataset(res['library_dataset_id'])
+        return self._get_new_dataset(res['library_dataset_id'], folder_id=fid)
 
     def create_folder(self, name, description=None, base_folder=None):
         """
@@ -1100,9 +1514,26 @@ class Library(DatasetContainer):
         bfid = None if base_folder is None else base_folder.id
         res = self.gi.gi.libraries.create_folder(
             self.id, name, description=description, base_folder_id=bfid)
-        self.refresh()
+        path = self._content_name(name, bfid)
+        if path is None:
+            object.__setattr__(self, '_content_infos', None)
+        else:
+            self._track_content({'id': res[0]['id'], 'name': path, 'type': 'folder'})
         return self.get_folder(res[0]['id'])
 
+    def _content_name(self, name, folder_id=None):
+        """
+        Return the full path of an item named ``name`` in the folder with id
+        ``folder_id`` (the root folder if ``None``), as used in the names of
+        content infos, or ``None`` if the folder is not among them.
+        """
+        if folder_id is None:
+            return '/' + name
+        for info in self._content_infos or []:
+            if info.id == folder_id and info.type == 'folder':
+                return info.name.rstrip('/') + '/' + name
+        return None
+
     def get_folder(self, f_id):
         """
         Retrieve the folder corresponding to the given id.
@@ -1110,8 +1541,10 @@ class Library(DatasetContainer):
         :rtype: :class:`~.Folder`
         :return: the folder corresponding to ``f_id``
         """
-        f_dict = self.gi.gi.libraries.show_folder(self.id, f_id)
-        return Folder(f_dict, self, gi=self.gi)
+        def fetch():
+            f_dict = self.gi.gi.libraries.show_folder(self.id, f_id)
+            return Folder(_owned(f_dict), self, gi=self.gi)
+        return self.gi._lookup(Folder, f_id, fetch)
 
     @property
     def root_folder(self):
@@ -1191,7 +1624,7 @@ class Folder(Wrapper):
         Returns: self
         """
         f_dict = self.gi.gi.libraries.show_folder(self.container.id, self.id)
-        self.__init__(f_dict, self.container, gi=self.gi)
+        self.__init__(_owned(f_dict), self.container, gi=self.gi)
         return self
 
 
@@ -1251,7 +1684,7 @@ class Tool(Wrapper):
 
 
 @six.add_metaclass(abc.ABCMeta)
-class Preview(Wrapper):
+class Preview(_CompactWrapper):
     """
     Abstract base class for Galaxy entity 'previews'.
 
@@ -1259,6 +1692,7 @@ class Preview(Wrapper):
     by global getters such as ``/api/libraries``.
     """
     BASE_ATTRS = Wrapper.BASE_ATTRS + ('deleted',)
+    __slots__ = ('deleted',)
 
     @abc.abstractmethod
     def __init__(self, pw_dict, gi=None):
@@ -1272,6 +1706,8 @@ class LibraryPreview(Preview):
     Instances of this class wrap dictionaries obtained by getting
     ``/api/libraries`` from Galaxy.
     """
+    __slots__ = ()
+
     def __init__(self, pw_dict, gi=None):
         super(LibraryPreview, self).__init__(pw_dict, gi=gi)
 
@@ -1288,6 +1724,7 @@ class HistoryPreview(Preview):
     ``/api/histories`` from Galaxy.
     """
     BASE_ATTRS = Preview.BASE_ATTRS + ('tags',)
+    __slots__ = ('tags',)
 
     def __init__(self, pw_dict, gi=None):
         super(HistoryPreview, self).__init__(pw_dict, gi=gi)
@@ -1305,6 +1742,7 @@ class WorkflowPreview(Preview):
     ``/api/workflows`` from Galaxy.
     """
     BASE_ATTRS = Preview.BASE_ATTRS + ('published', 'tags')
+    __slots__ = ('published', 'tags')
 
     def __init__(self, pw_dict, gi=None):
         super(WorkflowPreview, self).__init__(pw_dict, gi=gi)
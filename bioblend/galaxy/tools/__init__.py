@@ -2,10 +2,24 @@
 Contains possible interaction dealing with Galaxy tools.
 
 """
-from bioblend.galaxy.client import Client
-from bioblend.util import attach_file
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+
+from bioblend.galaxy.client import Client, CONNECTION_EXCEPTIONS, ConnectionError
+from bioblend.util import attach_file, TransferProgress
 from os.path import basename
-from json import dumps
+
+log = logging.getLogger(__name__)
+
+# Default size (in bytes) of the chunks sent by chunked uploads
+UPLOAD_CHUNK_SIZE = 10 * 1024 * 1024
+# HTTP status codes meaning that the server does not support chunked uploads
+CHUNKED_UPLOAD_UNSUPPORTED = (404, 405, 501)
 
 
 class ToolClient(Client):
@@ -35,9 +49,16 @@ class ToolClient(Client):
 
         :rtype: list
         :return: List of tool descriptions.
+
+        .. note::
+          Unless ``trackster`` is set, a ``tool_id`` is looked up directly
+          (returning the details of the tool) instead of fetching all the
+          tools.
         """
         if tool_id is not None and name is not None:
             raise ValueError('Provide only one argument between name or tool_id, but not both')
+        if tool_id is not None and not trackster:
+            return self._get_by_id(lambda: self.show_tool(tool_id))
         tools = self._raw_get_tool(in_panel=False, trackster=trackster)
         if tool_id is not None:
             tool = next((_ for _ in tools if _['id'] == tool_id), None)
@@ -46,6 +67,27 @@ class ToolClient(Client):
             tools = [_ for _ in tools if _['name'] == name]
         return tools
 
+    def iter_tools(self, name=None, trackster=None):
+        """
+        Iterate over all tools, or the ones with the provided ``name``,
+        yielding each one as soon as it has been received instead of waiting
+        for the whole list.
+
+        :type name: str
+        :param name: name of the requested tool(s)
+
+        :type trackster: boolean
+        :param trackster: if True, only tools that are compatible with
+          Trackster are returned
+
+        :rtype: generator of dict
+        :return: the tool descriptions, as returned by :meth:`get_tools`
+        """
+        params = {'in_panel': False, 'trackster': trackster}
+        for tool in Client._iter_get(self, params=params):
+            if name is None or tool['name'] == name:
+                yield tool
+
     def get_tool_panel(self):
         """
         Get a list of available tool elements in Galaxy's configured toolbox.
@@ -98,6 +140,11 @@ class ToolClient(Client):
         The ``tool_inputs`` dict should contain input datasets and parameters
         in the (largely undocumented) format used by the Galaxy API.
         Some examples can be found in https://bitbucket.org/galaxy/galaxy-central/src/tip/test/api/test_tools.py .
+
+        .. note::
+          Since running a tool twice starts two jobs, this request is retried
+          after a failure only if ``retry_non_idempotent`` is enabled in the
+          ``retry_policy`` of the Galaxy instance.
         """
         payload = {}
         payload["history_id"] = history_id
@@ -127,17 +174,196 @@ class ToolClient(Client):
 
         :type dbkey: str
         :param dbkey: (optional) genome dbkey
+
+        :type chunk_size: int
+        :param chunk_size: (optional) how many bytes of the file at a time
+          should be read into memory and sent
+
+        :type progress: callable
+        :param progress: (optional) function called with a
+          :class:`~bioblend.util.TransferProgress` (bytes sent, total size,
+          throughput and ETA) after each chunk is sent
+
+        :type chunked: bool
+        :param chunked: (optional) if ``True``, send the file in chunks of
+          ``upload_chunk_size`` bytes through the Galaxy chunked upload API.
+          A failed chunk is retried as configured by the ``retry_policy`` of
+          the Galaxy instance and, if the upload is interrupted, calling this
+          method again with the same arguments resumes it from the last chunk
+          received by Galaxy. If the server does not support chunked uploads,
+          the file is uploaded in a single request as usual
+
+        :type upload_chunk_size: int
+        :param upload_chunk_size: (optional) size of the chunks of a chunked
+          upload, must not exceed the ``chunk_upload_size`` of the Galaxy
+          server (100 MB by default)
+
+        :type resume_token: str
+        :param resume_token: (optional) path of the file where the state of a
+          chunked upload is saved to be able to resume it. By default, a file
+          in the temporary directory named after the Galaxy URL, history,
+          file path, size and modification time is used. It is deleted once
+          the upload is complete
         """
+        post_kwargs = dict((k, keywords.pop(k)) for k in ('chunk_size', 'progress') if k in keywords)
         default_file_name = basename(path)
         if "file_name" not in keywords:
             keywords["file_name"] = default_file_name
+        if keywords.pop("chunked", False):
+            res = self._upload_file_chunked(
+                path, history_id, keywords.pop("upload_chunk_size", UPLOAD_CHUNK_SIZE),
+                keywords.pop("resume_token", None), post_kwargs.get("progress"), **keywords)
+            if res is not None:
+                return res
+            log.info("Chunked uploads not supported by %s, using a single request", self.gi.base_url)
+        for k in ("upload_chunk_size", "resume_token"):
+            keywords.pop(k, None)
         payload = self._upload_payload(history_id, **keywords)
         payload["files_0|file_data"] = attach_file(path, name=keywords["file_name"])
         try:
-            return self._tool_post(payload, files_attached=True)
+            return self._tool_post(payload, files_attached=True, **post_kwargs)
         finally:
             payload["files_0|file_data"].close()
 
+    def upload_files(self, paths, history_id, **keywords):
+        """
+        Upload several files to the history specified by ``history_id`` with
+        a single request, creating one dataset per file.
+
+        :type paths: list of str
+        :param paths: paths of the files to upload
+
+        :type history_id: str
+        :param history_id: id of the history where to upload the files
+
+        :type file_names: list of str
+        :param file_names: (optional) names of the new history datasets, by
+          default the base names of ``paths``
+
+        See :meth:`upload_file` for the other optional parameters (except
+        file_name and the chunked upload ones).
+
+        :rtype: dict
+        :return: the tool output, with one item in ``outputs`` per file, in
+          the same order as ``paths``
+        """
+        post_kwargs = dict((k, keywords.pop(k)) for k in ('chunk_size', 'progress') if k in keywords)
+        file_names = keywords.pop("file_names", None) or [basename(_) for _ in paths]
+        if len(file_names) != len(paths):
+            raise ValueError("file_names must have the same length as paths")
+        payload = self._upload_payload(history_id, **keywords)
+        tool_input = payload["inputs"]
+        # Number of repeats of the files_N group of the upload tool
+        tool_input["file_count"] = len(paths)
+        try:
+            for i, (path, file_name) in enumerate(zip(paths, file_names)):
+                tool_input["files_%d|NAME" % i] = file_name
+                tool_input["files_%d|type" % i] = "upload_dataset"
+                payload["files_%d|file_data" % i] = attach_file(path, name=file_name)
+            res = self._tool_post(payload, files_attached=True, **post_kwargs)
+        finally:
+            for i in range(len(paths)):
+                if "files_%d|file_data" % i in payload:
+                    payload["files_%d|file_data" % i].close()
+        res["outputs"] = _sort_outputs(res.get("outputs", []), file_names)
+        return res
+
+    def _upload_file_chunked(self, path, history_id, upload_chunk_size, resume_token,
+                             progress, **keywords):
+        """
+        Upload a file with the Galaxy chunked upload API, then run the upload
+        tool on it. Return ``None`` if the server does not support chunked
+        uploads.
+        """
+        st = os.stat(path)
+        if resume_token is None:
+            key = '\0'.join(str(_) for _ in (
+                self.gi.url, history_id, os.path.abspath(path), st.st_size, st.st_mtime))
+            resume_token = os.path.join(
+                tempfile.gettempdir(),
+                'bioblend-upload-%s.json' % hashlib.sha1(key.encode('utf-8')).hexdigest())
+        state = None
+        if os.path.exists(resume_token):
+            with open(resume_token) as f:
+                state = json.load(f)
+            if state.get('size') != st.st_size or state.get('mtime') != st.st_mtime:
+                # The file has changed, start again
+                state = None
+        # The token is only saved after a chunk has been received, so a
+        # resumed upload with nothing left to send only needs the tool run
+        resumed = state is not None
+        if state is None:
+            state = {'session_id': uuid.uuid4().hex, 'offset': 0,
+                     'size': st.st_size, 'mtime': st.st_mtime}
+        url = '/'.join([self.gi.url, 'upload'])
+        transfer = TransferProgress(total=st.st_size)
+        transfer.update(state['offset'])
+        with open(path, 'rb') as f:
+            f.seek(state['offset'])
+            while not resumed or state['offset'] < st.st_size:
+                data = f.read(upload_chunk_size)
+                try:
+                    self._upload_chunk(url, state['session_id'], state['offset'], data)
+                except ConnectionError as e:
+                    if state['offset'] == 0 and e.status_code in CHUNKED_UPLOAD_UNSUPPORTED:
+                        return None
+                    raise
+                state['offset'] += len(data)
+                with open(resume_token, 'w') as token:
+                    json.dump(state, token)
+                transfer.update(len(data))
+                if progress is not None:
+                    progress(transfer)
+                if state['offset'] >= st.st_size:
+                    break
+        payload = self._upload_payload(history_id, **keywords)
+        payload["inputs"]["files_0|file_data"] = {
+            "session_id": state["session_id"],
+            "name": keywords["file_name"],
+        }
+        res = self._tool_post(payload)
+        os.remove(resume_token)
+        return res
+
+    def _upload_chunk(self, url, session_id, offset, data):
+        """
+        Send a chunk of a chunked upload, retrying as configured by the
+        ``retry_policy`` of the Galaxy instance.
+        """
+        payload = {
+            'session_id': session_id,
+            'session_start': str(offset),
+            'session_chunk': ('chunk', data),
+        }
+        policy = self.gi.retry_policy
+        # Chunks can be sent again safely: Galaxy rejects a chunk which does
+        # not start at the current size of the uploaded file
+        attempts_left = policy.attempts('PUT')
+        delays = iter(policy.backoff())
+        may_have_been_received = False
+        while True:
+            attempts_left -= 1
+            try:
+                return self.gi.make_post_request(url, payload, files_attached=True)
+            except CONNECTION_EXCEPTIONS as e:
+                if attempts_left <= 0:
+                    raise
+                may_have_been_received = True
+                msg = str(e)
+            except ConnectionError as e:
+                if may_have_been_received and 'session start' in (e.body or ''):
+                    # The previous attempt reached Galaxy after all, so the
+                    # upload goes on from the end of this chunk
+                    return None
+                if attempts_left <= 0 or e.status_code not in policy.retry_statuses:
+                    raise
+                # e.g. a proxy error sent after Galaxy has stored the chunk
+                may_have_been_received = True
+                msg = str(e)
+            log.warn("Upload of chunk at offset %d failed: %s, %d attempts left",
+                     offset, msg, attempts_left)
+            time.sleep(next(delays))
+
     def paste_content(self, content, history_id, **kwds):
         """
         Upload a string to a new dataset in the history specified by
@@ -173,7 +399,7 @@ class ToolClient(Client):
         payload["inputs"] = tool_input
         return payload
 
-    def _tool_post(self, payload, files_attached=False):
+    def _tool_post(self, payload, files_attached=False, **kwargs):
         if files_attached:
             # If files_attached - this will be posted as multi-part form data
             # and so each individual parameter needs to be encoded so can be
@@ -184,5 +410,21 @@ class ToolClient(Client):
             complex_payload_params = ["inputs"]
             for key in complex_payload_params:
                 if key in payload:
-                    payload[key] = dumps(payload[key])
-        return Client._post(self, payload, files_attached=files_attached)
+                    payload[key] = self.gi.json_codec.dumps(payload[key])
+        return Client._post(self, payload, files_attached=files_attached, **kwargs)
+
+
+def _sort_outputs(outputs, names):
+    """
+    Sort the ``outputs`` of an upload tool run in the order of the dataset
+    ``names`` they were uploaded with, matching them by name. Outputs whose
+    name does not match are kept in their order in the unmatched places.
+    """
+    by_name = {}
+    for out in outputs:
+        by_name.setdefault(out.get('name'), []).append(out)
+    matched = [by_name[name].pop(0) if by_name.get(name) else None for name in names]
+    matched_ids = set(id(_) for _ in matched if _ is not None)
+    unmatched = iter([_ for _ in outputs if id(_) not in matched_ids])
+    res = [out if out is not None else next(unmatched, None) for out in matched]
+    return [_ for _ in res if _ is not None] + list(unmatched)
@@ -40,17 +40,23 @@ class WorkflowClient(Client):
                      u'name': u'Simple',
                      u'url': u'/api/workflows/92c56938c2f9b315'}]
 
+        .. note::
+          A ``workflow_id`` is looked up directly instead of fetching all the
+          workflows. The returned list then contains the details of the
+          workflow (as returned by :meth:`show_workflow`) instead of its
+          summary, and it includes any workflow accessible to the user,
+          e.g. published or shared by other users, whatever the value of
+          ``published``.
         """
         if workflow_id is not None and name is not None:
             raise ValueError('Provide only one argument between name or workflow_id, but not both')
+        if workflow_id is not None:
+            return self._get_by_id(lambda: self.show_workflow(workflow_id), deleted=False)
         kwargs = {}
         if published:
             kwargs['params'] = {'show_published': 'True'}
         workflows = Client._get(self, **kwargs)
-        if workflow_id is not None:
-            workflow = next((_ for _ in workflows if _['id'] == workflow_id), None)
-            workflows = [workflow] if workflow is not None else []
-        elif name is not None:
+        if name is not None:
             workflows = [_ for _ in workflows if _['name'] == name]
         return workflows
 
@@ -6,19 +6,67 @@ should not use it directly.
 A base representation of an instance
 """
 import base64
-import json
+import threading
+import time
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests_toolbelt import MultipartEncoder
 import six
 from six.moves.urllib.parse import urljoin, urlparse
 
-from .galaxy.client import ConnectionError
+import bioblend
+from .galaxy.client import CONNECTION_EXCEPTIONS, ConditionalGetCache, ConnectionError, ResponseCache, RetryPolicy
+from .util import concurrent_map, default_json_codec, TransferProgress
+
+
+# Exceptions that interrupt a streamed download and allow it to be resumed
+DOWNLOAD_EXCEPTIONS = CONNECTION_EXCEPTIONS + (
+    requests.exceptions.ChunkedEncodingError, requests.exceptions.Timeout)
+
+# Minimum size (in bytes) of each byte range in a segmented download
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+
+# Default number of per-host connection pools kept by the HTTP session
+POOL_CONNECTIONS = 10
+# Default number of keep-alive connections kept in each per-host pool
+POOL_MAXSIZE = 10
+
+
+class UploadStream(object):
+    """
+    File-like view of a multipart request body, which is read (and so sent)
+    at most ``chunk_size`` bytes at a time, keeping memory usage constant
+    whatever the size of the attached files.
+
+    If ``progress`` is provided, it is called with a
+    :class:`~bioblend.util.TransferProgress` after each chunk is read.
+    """
+    def __init__(self, encoder, chunk_size=bioblend.CHUNK_SIZE, progress=None):
+        self.encoder = encoder
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.content_type = encoder.content_type
+        # Used by requests to set the Content-Length header
+        self.len = encoder.len
+        self.transfer = TransferProgress(total=encoder.len)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.chunk_size
+        data = self.encoder.read(min(size, self.chunk_size))
+        self.transfer.update(len(data))
+        if self.progress is not None:
+            self.progress(self.transfer)
+        return data
 
 
 class GalaxyClient(object):
 
-    def __init__(self, url, key=None, email=None, password=None):
+    def __init__(self, url, key=None, email=None, password=None,
+                 pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                 retry_policy=None, cache=None, conditional_get=None,
+                 json_codec=None):
         # Make sure the url scheme is defined (otherwise requests will not work)
         if not urlparse(url).scheme:
             url = "http://" + url
@@ -35,6 +83,48 @@ class GalaxyClient(object):
             self.password = password
         self.json_headers = {'Content-Type': 'application/json'}
         self.verify = True  # Should SSL verification be done
+        self.pool_maxsize = pool_maxsize
+        self.session = self._make_session(pool_connections, pool_maxsize)
+        # How failed requests are retried, see RetryPolicy
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        # Cache of the responses to GET requests (None: disabled), see ResponseCache
+        self.cache = ResponseCache() if cache is True else cache
+        # Validators of the responses to GET requests, used to make
+        # conditional requests (None: disabled), see ConditionalGetCache
+        self.conditional_get = ConditionalGetCache() if conditional_get is True else conditional_get
+        # Encoding and decoding of JSON request and response bodies
+        self.json_codec = json_codec if json_codec is not None else default_json_codec
+
+    @staticmethod
+    def _make_session(pool_connections, pool_maxsize):
+        """
+        Create the HTTP session shared by all the clients of this instance.
+
+        The session keeps connections alive between requests, so that
+        consecutive API calls do not pay for a new TCP (and TLS) handshake.
+
+        :type pool_connections: int
+        :param pool_connections: number of per-host connection pools to cache
+
+        :type pool_maxsize: int
+        :param pool_maxsize: maximum number of connections to keep in each
+          per-host pool, i.e. the number of requests to the same host that
+          can reuse a connection concurrently
+        """
+        if pool_connections < 1 or pool_maxsize < 1:
+            raise ValueError("Connection pool sizes must be >= 1 (got: %s, %s)"
+                             % (pool_connections, pool_maxsize))
+        session = requests.Session()
+        for prefix in ('http://', 'https://'):
+            session.mount(prefix, HTTPAdapter(pool_connections=pool_connections,
+                                              pool_maxsize=pool_maxsize))
+        return session
+
+    def close(self):
+        """
+        Close all the connections kept alive by this instance.
+        """
+        self.session.close()
 
     def _make_url(self, module, module_id=None, deleted=False, contents=False):
         """
@@ -66,6 +156,225 @@ class GalaxyClient(object):
                 c_url = '/'.join([c_url, 'contents'])
         return c_url
 
+    def _request(self, method, url, retry=True, **kwargs):
+        """
+        Send an HTTP request through the shared session, retrying it on
+        connection errors and on the HTTP statuses listed in
+        ``self.retry_policy``, if the policy allows retrying ``method``.
+
+        Set ``retry`` to ``False`` to send the request only once (e.g. if the
+        request body cannot be read again).
+        """
+        policy = self.retry_policy
+        attempts_left = policy.attempts(method) if retry else 1
+        delays = iter(policy.backoff())
+        while True:
+            attempts_left -= 1
+            try:
+                r = self.session.request(method, url, **kwargs)
+            except CONNECTION_EXCEPTIONS as e:
+                if attempts_left <= 0:
+                    raise
+                msg = str(e)
+            else:
+                if attempts_left <= 0 or r.status_code not in policy.retry_statuses:
+                    return r
+                msg = "error %s" % r.status_code
+            bioblend.log.warn("%s %s: %s, %d attempts left",
+                              method, url, msg, attempts_left)
+            time.sleep(next(delays))
+
+    def _download(self, url, fp, chunk_size=bioblend.CHUNK_SIZE, offset=0,
+                  expected_size=None, r=None, segments=1, **kwargs):
+        """
+        Download ``url`` with a streamed GET request, writing the response
+        body to the binary file object ``fp``.
+
+        ``offset`` is the number of bytes of the file already written to
+        ``fp`` (just before its current position) by a previous, interrupted
+        download: only the rest of the file is requested, with an HTTP
+        ``Range`` header. If the transfer is interrupted, it is resumed in the
+        same way from the last written byte, up to
+        ``self.retry_policy.max_attempts`` times. If the server ignores the
+        ``Range`` header, the file is downloaded again from the beginning.
+
+        The size of the downloaded file is checked against the size
+        advertised by the server or, failing that, against ``expected_size``.
+
+        ``r`` can be an already open streamed response to a GET request for
+        the whole file, which is used instead of sending a new request if
+        ``offset`` is 0. Other keyword arguments are passed to
+        ``self.session.get``.
+
+        If ``segments`` is greater than 1, ``fp`` is seekable and ``r`` shows
+        that the server supports range requests, the file is split in up to
+        ``segments`` byte ranges which are downloaded concurrently, see
+        :meth:`_download_segments`.
+
+        Return the size of the downloaded file.
+        """
+        kwargs.setdefault('verify', self.verify)
+        headers = kwargs.pop('headers', None) or {}
+        if segments > 1 and r is not None and offset == 0:
+            size = self._content_total(r)
+            accept_ranges = r.headers.get('accept-ranges', '').lower() == 'bytes'
+            if size and size >= 2 * MIN_SEGMENT_SIZE and accept_ranges:
+                r.close()
+                return self._download_segments(url, fp, size, segments,
+                                               chunk_size=chunk_size,
+                                               headers=headers, **kwargs)
+        policy = self.retry_policy
+        attempts_left = policy.max_attempts
+        delays = iter(policy.backoff())
+        if r is not None and offset > 0:
+            r.close()
+            r = None
+        while True:
+            attempts_left -= 1
+            total = expected_size
+            try:
+                if r is None:
+                    req_headers = dict(headers)
+                    if offset > 0:
+                        req_headers['Range'] = 'bytes=%d-' % offset
+                    r = self.session.get(url, stream=True, headers=req_headers, **kwargs)
+                try:
+                    if r.status_code == 416 and offset > 0:
+                        # Range not satisfiable, i.e. nothing left to download
+                        # if the file was already complete
+                        if self._content_total(r) == offset:
+                            return offset
+                        total = None
+                        fp.seek(fp.tell() - offset)
+                        fp.truncate()
+                        offset = 0
+                        r.close()
+                        r = None
+                        continue
+                    r.raise_for_status()
+                    if r.status_code != 206 and offset > 0:
+                        # Range not supported, start again from scratch
+                        fp.seek(fp.tell() - offset)
+                        fp.truncate()
+                        offset = 0
+                    total = self._content_total(r) or expected_size
+                    for chunk in r.iter_content(chunk_size):
+                        fp.write(chunk)
+                        offset += len(chunk)
+                finally:
+                    if r is not None:
+                        r.close()
+                        r = None
+                if total is None or offset == total:
+                    return offset
+                if offset > total:
+                    raise ConnectionError(
+                        "Downloaded %d bytes from %s, expected %d" % (offset, url, total))
+                msg = "incomplete download (%d of %d bytes)" % (offset, total)
+            except DOWNLOAD_EXCEPTIONS as e:
+                if attempts_left <= 0:
+                    raise
+                msg = str(e)
+            if attempts_left <= 0:
+                raise ConnectionError("Failed to download %s: %s" % (url, msg))
+            bioblend.log.warn("GET %s: %s, resuming from byte %d, %d attempts left",
+                              url, msg, offset, attempts_left)
+            time.sleep(next(delays))
+
+    def _download_segments(self, url, fp, size, segments,
+                           chunk_size=bioblend.CHUNK_SIZE, **kwargs):
+        """
+        Download the ``size`` bytes of ``url`` to the seekable binary file
+        object ``fp``, starting at its current position. The file is
+        preallocated, then split in up to ``segments`` byte ranges (of at
+        least ``MIN_SEGMENT_SIZE`` bytes each), which are requested
+        concurrently over separate connections and written each at its own
+        position. An interrupted range is resumed like in :meth:`_download`.
+
+        If the download fails, ``fp`` is truncated back to its initial
+        position. Return ``size``.
+        """
+        n_segments = max(1, min(segments, size // MIN_SEGMENT_SIZE))
+        base = fp.tell()
+        lock = threading.Lock()
+
+        def download_range(bounds):
+            self._download_range(url, fp, lock, base, bounds[0], bounds[1],
+                                 chunk_size=chunk_size, **kwargs)
+
+        try:
+            # Preallocate the file
+            fp.seek(base + size - 1)
+            fp.write(b'\0')
+            concurrent_map(download_range,
+                           [(i * size // n_segments, (i + 1) * size // n_segments - 1)
+                            for i in range(n_segments)],
+                           max_workers=n_segments)
+        except BaseException:
+            fp.seek(base)
+            fp.truncate()
+            raise
+        fp.seek(base + size)
+        return size
+
+    def _download_range(self, url, fp, lock, base, start, end,
+                        chunk_size=bioblend.CHUNK_SIZE, **kwargs):
+        """
+        Download the bytes from ``start`` to ``end`` (inclusive) of ``url``
+        and write them to ``fp`` at ``base + start``, holding ``lock`` for
+        each write.
+        """
+        headers = kwargs.pop('headers', None) or {}
+        policy = self.retry_policy
+        attempts_left = policy.max_attempts
+        delays = iter(policy.backoff())
+        while True:
+            attempts_left -= 1
+            try:
+                req_headers = dict(headers)
+                req_headers['Range'] = 'bytes=%d-%d' % (start, end)
+                r = self.session.get(url, stream=True, headers=req_headers, **kwargs)
+                try:
+                    r.raise_for_status()
+                    if r.status_code != 206:
+                        raise ConnectionError("Range requests not supported for %s" % url)
+                    for chunk in r.iter_content(chunk_size):
+                        chunk = chunk[:end + 1 - start]
+                        with lock:
+                            fp.seek(base + start)
+                            fp.write(chunk)
+                        start += len(chunk)
+                finally:
+                    r.close()
+                if start > end:
+                    return
+                msg = "incomplete range (%d bytes left)" % (end + 1 - start)
+            except DOWNLOAD_EXCEPTIONS as e:
+                if attempts_left <= 0:
+                    raise
+                msg = str(e)
+            if attempts_left <= 0:
+                raise ConnectionError("Failed to download %s: %s" % (url, msg))
+            bioblend.log.warn("GET %s: %s, resuming from byte %d, %d attempts left",
+                              url, msg, start, attempts_left)
+            time.sleep(next(delays))
+
+    @staticmethod
+    def _content_total(r):
+        """
+        Return the total size of the file (part of) which is the body of the
+        response ``r``, if advertised by the server, else ``None``.
+        """
+        content_range = r.headers.get('content-range')
+        if content_range:
+            total = content_range.rpartition('/')[2].strip()
+            return int(total) if total.isdigit() else None
+        content_length = r.headers.get('content-length')
+        # With a Content-Encoding, Content-Length is the size of the encoded body
+        if r.status_code == 206 or not content_length or 'content-encoding' in r.headers:
+            return None
+        return int(content_length) if content_length.isdigit() else None
+
     def make_get_request(self, url, **kwargs):
         """
         Make a GET request using the provided ``url``.
@@ -86,16 +395,21 @@ class GalaxyClient(object):
             params = self.default_params
         kwargs['params'] = params
         kwargs.setdefault('verify', self.verify)
-        r = requests.get(url, **kwargs)
+        r = self.session.get(url, **kwargs)
         return r
 
-    def make_post_request(self, url, payload, params=None, files_attached=False):
+    def make_post_request(self, url, payload, params=None, files_attached=False,
+                          chunk_size=bioblend.CHUNK_SIZE, progress=None):
         """
         Make a POST request using the provided ``url`` and ``payload``.
         The ``payload`` must be a dict that contains the request values.
         The payload dict may contain file handles (in which case the files_attached
         flag must be set to true).
 
+        Attached files are streamed ``chunk_size`` bytes at a time and, if
+        ``progress`` is provided, it is called with a
+        :class:`~bioblend.util.TransferProgress` after each chunk is sent.
+
         If the ``params`` are not provided, use ``default_params`` class field.
         If params are provided and the provided dict does not have ``key`` key,
         the default ``self.key`` value will be included in what's passed to
@@ -112,30 +426,33 @@ class GalaxyClient(object):
         # leveraging the requests-toolbelt library if any files have
         # been attached.
         if files_attached:
-            payload.update(params)
-            payload = MultipartEncoder(fields=payload)
+            fields = dict(payload)
+            fields.update(params)
+            payload = UploadStream(MultipartEncoder(fields=fields),
+                                   chunk_size=chunk_size, progress=progress)
             headers = self.json_headers.copy()
             headers['Content-Type'] = payload.content_type
             post_params = {}
         else:
-            payload = json.dumps(payload)
+            payload = self.json_codec.dumps(payload)
             headers = self.json_headers
             post_params = params
 
-        r = requests.post(url, data=payload, headers=headers,
-                          verify=self.verify, params=post_params)
+        r = self._request('POST', url, retry=not files_attached, data=payload,
+                          headers=headers, verify=self.verify,
+                          params=post_params)
         if r.status_code == 200:
-            return r.json()
+            return self.json_codec.loads(r.content)
         # @see self.body for HTTP response body
         raise ConnectionError("Unexpected response from galaxy: %s" %
-                              r.status_code, body=r.text)
+                              r.status_code, body=r.text, status_code=r.status_code)
 
     def make_delete_request(self, url, payload=None, params=None):
         """
         Make a DELETE request using the provided ``url`` and the optional
         arguments.
         The ``payload`` must be a dict that can be converted into a JSON
-        object (via ``json.dumps``)
+        object (via the ``json_codec``)
 
         If the ``params`` are not provided, use ``default_params`` class field.
         If params are provided and the provided dict does not have ``key`` key,
@@ -146,22 +463,24 @@ class GalaxyClient(object):
             params['key'] = self.key
         else:
             params = self.default_params
-        r = requests.delete(url, verify=self.verify, data=payload, params=params)
+        r = self._request('DELETE', url, verify=self.verify, data=payload,
+                          params=params)
         return r
 
     def make_put_request(self, url, payload=None, params=None):
         """
         Make a PUT request using the provided ``url`` with required playload
         The ``payload`` must be a dict that can be converted into a JSON
-        object (via ``json.dumps``)
+        object (via the ``json_codec``)
         """
         if params is not None and params.get('key', False) is False:
             params['key'] = self.key
         else:
             params = self.default_params
 
-        payload = json.dumps(payload)
-        r = requests.put(url, verify=self.verify, data=payload, params=params)
+        payload = self.json_codec.dumps(payload)
+        r = self._request('PUT', url, verify=self.verify, data=payload,
+                          params=params)
         return r
 
     @property
@@ -174,13 +493,13 @@ class GalaxyClient(object):
             auth_url = "%s/authenticate/baseauth" % self.url
             # make_post_request uses default_params, which uses this and
             # sets wrong headers - so using lower level method.
-            r = requests.get(auth_url, verify=self.verify, headers=headers)
+            r = self.session.get(auth_url, verify=self.verify, headers=headers)
             if r.status_code != 200:
                 raise Exception("Failed to authenticate user.")
-            response = r.json()
+            response = self.json_codec.loads(r.content)
             if isinstance(response, (six.string_types, six.text_type)):
                 # bug in Tool Shed
-                response = json.loads(response)
+                response = self.json_codec.loads(response)
             self._key = response["api_key"]
         return self._key
 
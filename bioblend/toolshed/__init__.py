@@ -2,11 +2,13 @@
 A base representation of an instance of Tool Shed
 """
 from bioblend.toolshed import (repositories)
-from bioblend.galaxyclient import GalaxyClient
+from bioblend.galaxyclient import GalaxyClient, POOL_CONNECTIONS, POOL_MAXSIZE
 
 
 class ToolShedInstance(GalaxyClient):
-    def __init__(self, url, key='', email=None, password=None):
+    def __init__(self, url, key='', email=None, password=None,
+                 pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                 retry_policy=None):
         """
         A base representation of an instance of ToolShed, identified by a
         URL and a user's API key.
@@ -30,6 +32,19 @@ class ToolShedInstance(GalaxyClient):
         :type key: string
         :param key: If required, user's API key for the given instance of ToolShed,
                     obtained from the user preferences.
+
+        :type pool_connections: int
+        :param pool_connections: Number of per-host connection pools to keep.
+
+        :type pool_maxsize: int
+        :param pool_maxsize: Maximum number of keep-alive connections to keep
+                             for each host.
+
+        :type retry_policy: :class:`~bioblend.galaxy.client.RetryPolicy`
+        :param retry_policy: How failed requests to this instance are retried.
         """
-        super(ToolShedInstance, self).__init__(url, key, email, password)
+        super(ToolShedInstance, self).__init__(url, key, email, password,
+                                               pool_connections=pool_connections,
+                                               pool_maxsize=pool_maxsize,
+                                               retry_policy=retry_policy)
         self.repositories = repositories.ToolShedClient(self)
@@ -6,6 +6,12 @@ from six.moves.urllib.parse import urljoin
 from bioblend.galaxy.client import Client
 from bioblend.util import attach_file
 
+# Boolean filters accepted by the repository_revisions API
+REPOSITORY_REVISIONS_FILTERS = (
+    'downloadable', 'malicious', 'tools_functionally_correct',
+    'missing_test_components', 'do_not_test', 'includes_tools',
+    'test_install_error', 'skip_tool_test')
+
 
 class ToolShedClient(Client):
 
@@ -168,27 +174,33 @@ class ToolShedClient(Client):
         # Not using '_make_url' or '_get' to create url since the module id used
         # to create url is not the same as needed for this method
         url = self.gi.url + '/repository_revisions'
-        params = {}
-
-        # nice and long... my god!
-        if downloadable:
-            params['downloadable'] = 'True'
-        if malicious:
-            params['malicious'] = 'True'
-        if tools_functionally_correct:
-            params['tools_functionally_correct'] = 'True'
-        if missing_test_components:
-            params['missing_test_components'] = 'True'
-        if do_not_test:
-            params['do_not_test'] = 'True'
-        if includes_tools:
-            params['includes_tools'] = 'True'
-        if test_install_error:
-            params['test_install_error'] = 'True'
-        if skip_tool_test:
-            params['skip_tool_test'] = 'True'
+        params = self._repository_revisions_params(
+            downloadable=downloadable, malicious=malicious,
+            tools_functionally_correct=tools_functionally_correct,
+            missing_test_components=missing_test_components,
+            do_not_test=do_not_test, includes_tools=includes_tools,
+            test_install_error=test_install_error, skip_tool_test=skip_tool_test)
+        return Client._get(self, url=url, params=params)
+
+    def iter_repository_revisions(self, **kwargs):
+        """
+        Iterate over the (possibly filtered) repository revisions, yielding
+        each one as soon as it has been received instead of waiting for the
+        whole list. Accepts the same filters as :meth:`repository_revisions`.
 
-        return Client._get(self, url=url, params=params).json()
+        :rtype: generator of dict
+        :return: the repository revisions, as returned by
+          :meth:`repository_revisions`
+        """
+        url = self.gi.url + '/repository_revisions'
+        params = self._repository_revisions_params(**kwargs)
+        return Client._iter_get(self, url=url, params=params)
+
+    def _repository_revisions_params(self, **kwargs):
+        unknown = set(kwargs) - set(REPOSITORY_REVISIONS_FILTERS)
+        if unknown:
+            raise TypeError("Unknown repository revision filters: %s" % ', '.join(sorted(unknown)))
+        return dict((_, 'True') for _ in REPOSITORY_REVISIONS_FILTERS if kwargs.get(_))
 
     def show_repository_revision(self, metadata_id):
         '''
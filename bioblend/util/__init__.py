@@ -1,5 +1,17 @@
+import codecs
+import json
 import os
+import random
+import re
+import sys
+import time
 from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+# Default maximum number of worker threads for concurrent operations
+MAX_WORKERS = 10
+
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
 
 
 class Bunch(object):
@@ -50,7 +62,337 @@ def attach_file(path, name=None):
     attachment = FileStream(name, open(path, "rb"))
     return attachment
 
+
+class TransferProgress(object):
+    """
+    Progress of a data transfer, passed to the ``progress`` callbacks of the
+    upload methods.
+
+    :type total: int
+    :param total: total number of bytes to transfer, ``None`` if unknown
+    """
+    def __init__(self, total=None):
+        self.total = total
+        self.transferred = 0
+        self.start_time = time.time()
+
+    def update(self, n_bytes):
+        """
+        Record that ``n_bytes`` more bytes have been transferred.
+        """
+        self.transferred += n_bytes
+
+    @property
+    def elapsed(self):
+        """
+        Seconds elapsed since the beginning of the transfer.
+        """
+        return time.time() - self.start_time
+
+    @property
+    def rate(self):
+        """
+        Average throughput of the transfer, in bytes per second.
+        """
+        elapsed = self.elapsed
+        return self.transferred / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """
+        Estimated number of seconds until the end of the transfer, ``None``
+        if unknown.
+        """
+        if self.total is None:
+            return None
+        if self.transferred >= self.total:
+            return 0.0
+        rate = self.rate
+        return (self.total - self.transferred) / rate if rate > 0 else None
+
+    def __repr__(self):
+        return "TransferProgress(transferred=%r, total=%r, rate=%.1f)" % (
+            self.transferred, self.total, self.rate)
+
+
+class JSONCodec(object):
+    """
+    Encode and decode JSON with a fast third-party library if installed,
+    falling back to the standard library ``json`` module.
+
+    Faster libraries may not decode JSON exactly as the standard library
+    does (e.g. ujson with floats and big integers), so they are only used
+    if a codec is passed explicitly, see the ``json_codec`` parameter of
+    :class:`~bioblend.galaxy.GalaxyInstance`.
+
+    :type library: str
+    :param library: name of the JSON library to use, among ``LIBRARIES``.
+      By default, the first one which can be imported
+    """
+    # Supported JSON libraries, in order of preference
+    LIBRARIES = ('orjson', 'ujson', 'json')
+
+    def __init__(self, library=None):
+        for name in (library,) if library is not None else self.LIBRARIES:
+            try:
+                # not importlib, which is not available on Python 2.6
+                __import__(name)
+            except ImportError:
+                if library is not None:
+                    raise
+                continue
+            break
+        module = sys.modules[name]
+        self.library = name
+        self._loads = module.loads
+        if name == 'orjson':
+            self._dumps = lambda obj: module.dumps(obj).decode('utf-8')
+        else:
+            self._dumps = module.dumps
+
+    def dumps(self, obj):
+        """
+        Serialize ``obj`` to a JSON string.
+        """
+        try:
+            return self._dumps(obj)
+        except (OverflowError, TypeError, ValueError):
+            if self.library == 'json':
+                raise
+            # e.g. non-string keys or big integers, which not all the
+            # libraries support
+            return json.dumps(obj)
+
+    def loads(self, s):
+        """
+        Deserialize a JSON document from a string or UTF-8 encoded bytes.
+        Raise a ``ValueError`` if it is not valid JSON.
+        """
+        if self.library == 'json' and isinstance(s, bytes):
+            s = s.decode('utf-8')
+        try:
+            return self._loads(s)
+        except OverflowError as e:
+            # e.g. ujson on integers it cannot represent
+            raise ValueError(str(e))
+
+    def __repr__(self):
+        return "JSONCodec(library=%r)" % self.library
+
+
+# JSON codec shared by default by all the Galaxy and Tool Shed instances
+default_json_codec = JSONCodec('json')
+
+
+def concurrent_map(func, iterable, max_workers=MAX_WORKERS,
+                   return_exceptions=False):
+    """
+    Apply ``func`` to each item of ``iterable`` using a bounded pool of
+    threads.
+
+    :type max_workers: int
+    :param max_workers: maximum number of concurrent calls to ``func``
+
+    :type return_exceptions: bool
+    :param return_exceptions: if ``True``, an exception raised by ``func``
+      is returned in place of the result for the corresponding item;
+      otherwise, the first exception (in input order) is raised once all
+      the items have been processed.
+
+    :rtype: list
+    :return: the results, in the same order as the input items
+    """
+    if max_workers < 1:
+        raise ValueError("Number of workers must be >= 1 (got: %s)" % max_workers)
+    items = list(iterable)
+
+    def call(item):
+        try:
+            return func(item), None
+        except Exception as e:
+            return None, e
+
+    if max_workers == 1 or len(items) <= 1:
+        outcomes = [call(_) for _ in items]
+    else:
+        pool = ThreadPool(min(max_workers, len(items)))
+        try:
+            outcomes = pool.map(call, items, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    results = []
+    for res, exc in outcomes:
+        if exc is None:
+            results.append(res)
+        elif return_exceptions:
+            results.append(exc)
+        else:
+            raise exc
+    return results
+
+
+class Backoff(object):
+    """
+    An exponential backoff schedule for polling and retry loops.
+
+    Iterating over a ``Backoff`` yields the successive delays (in seconds)
+    to wait between attempts: the base delay starts at ``initial_delay`` and
+    is multiplied by ``factor`` at each step, up to ``max_delay``. A random
+    jitter of up to ``jitter`` times the base delay is added to each delay,
+    so that clients polling at the same time do not hit the server in
+    lockstep.
+
+    If ``timeout`` is set, the iteration stops once ``timeout`` seconds have
+    elapsed since the iteration started, the last delay being shortened to
+    fit the deadline.
+    """
+    def __init__(self, initial_delay=1, max_delay=60, factor=2, jitter=0.1,
+                 timeout=None):
+        if initial_delay < 0 or max_delay < 0:
+            raise ValueError("Delays must be >= 0 (got: %s, %s)" % (initial_delay, max_delay))
+        if factor < 1:
+            raise ValueError("Backoff factor must be >= 1 (got: %s)" % factor)
+        if jitter < 0:
+            raise ValueError("Jitter must be >= 0 (got: %s)" % jitter)
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.timeout = timeout
+
+    def __iter__(self):
+        deadline = None if self.timeout is None else time.time() + self.timeout
+        return self._delays(deadline)
+
+    def _delays(self, deadline):
+        base = min(self.initial_delay, self.max_delay)
+        while True:
+            delay = base + random.uniform(0, self.jitter * base)
+            if deadline is not None:
+                time_left = deadline - time.time()
+                if time_left <= 0:
+                    return
+                delay = min(delay, time_left)
+            yield delay
+            base = min(base * self.factor, self.max_delay)
+
+
+def wait_for(predicate, backoff=None, on_wait=None):
+    """
+    Call ``predicate`` until it returns a true value, sleeping between
+    calls according to ``backoff``.
+
+    :type predicate: callable
+    :param predicate: function called without arguments. Exceptions raised
+      by it are not caught, so it can abort the wait (e.g. on error states)
+
+    :type backoff: :class:`Backoff`
+    :param backoff: delay schedule, by default ``Backoff()``
+
+    :type on_wait: callable
+    :param on_wait: if provided, called with the next delay before each
+      sleep (e.g. for logging)
+
+    :rtype: bool
+    :return: ``True`` if ``predicate`` returned a true value, ``False`` if
+      the ``backoff`` timeout expired first
+    """
+    if backoff is None:
+        backoff = Backoff()
+    delays = iter(backoff)
+    while not predicate():
+        try:
+            delay = next(delays)
+        except StopIteration:
+            return False
+        if on_wait is not None:
+            on_wait(delay)
+        time.sleep(delay)
+    return True
+
+
+def iter_json_array(chunks):
+    """
+    Incrementally parse a JSON array from an iterable of UTF-8 encoded
+    ``chunks`` (e.g. ``requests.Response.iter_content()``), yielding each
+    element as soon as it has been received, so that only the element being
+    parsed is kept in memory.
+
+    Raise a ``ValueError`` if the data is not a JSON array.
+
+    :type chunks: iterable of bytes
+    :param chunks: the JSON document, split in chunks of any size
+
+    :rtype: generator
+    :return: the elements of the array
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buf = ''
+    pos = 0
+    eof = False
+    # What is expected next: '[' ('start'), a value or ']' ('first'), a
+    # value ('value'), or ',' or ']' ('separator')
+    state = 'start'
+    while True:
+        pending = False
+        pos = _JSON_WHITESPACE.match(buf, pos).end()
+        if pos < len(buf):
+            c = buf[pos]
+            if state == 'start':
+                if c != '[':
+                    raise ValueError("Expecting a JSON array")
+                pos += 1
+                state = 'first'
+                continue
+            if c == ']' and state in ('first', 'separator'):
+                return
+            if state == 'separator':
+                if c != ',':
+                    raise ValueError("Expecting ',' delimiter in JSON array")
+                pos += 1
+                state = 'value'
+                continue
+            try:
+                item, end = decoder.raw_decode(buf, idx=pos)
+            except ValueError:
+                if eof:
+                    raise
+                pending = True
+            else:
+                # A number at the end of the buffer may be truncated
+                if end < len(buf) or eof:
+                    yield item
+                    pos = end
+                    state = 'separator'
+                    continue
+                pending = True
+        if eof:
+            raise ValueError("Unexpected end of JSON array")
+        # Read at least as much again as the pending text of an incomplete
+        # element before retrying, so that large elements are decoded in
+        # linear time
+        buf = buf[pos:]
+        pos = 0
+        wanted = 2 * len(buf) if pending else 1
+        while len(buf) < wanted and not eof:
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+                buf += utf8.decode(b'', True)
+            else:
+                buf += utf8.decode(chunk)
+
+
 __all__ = [
+    'Backoff',
     'Bunch',
+    'JSONCodec',
+    'TransferProgress',
     'attach_file',
+    'concurrent_map',
+    'iter_json_array',
+    'wait_for',
 ]
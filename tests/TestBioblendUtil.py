@@ -0,0 +1,111 @@
+"""
+Tests on the helpers in ``bioblend.util``.
+
+Use ``nose`` to run these unit tests.
+"""
+import itertools
+import json
+import sys
+
+from test_util import unittest
+
+from bioblend.util import (Backoff, JSONCodec, concurrent_map, default_json_codec,
+                           iter_json_array, wait_for)
+
+
+class TestConcurrentMap(unittest.TestCase):
+
+    def test_order(self):
+        self.assertEqual(concurrent_map(lambda x: x * 2, range(20), max_workers=4),
+                         [x * 2 for x in range(20)])
+
+    def test_exceptions(self):
+        def f(x):
+            if x % 2:
+                raise ValueError(x)
+            return x
+        self.assertRaises(ValueError, concurrent_map, f, range(4))
+        res = concurrent_map(f, range(4), return_exceptions=True)
+        self.assertEqual(res[0::2], [0, 2])
+        for e in res[1::2]:
+            self.assertIsInstance(e, ValueError)
+
+
+class TestBackoff(unittest.TestCase):
+
+    def test_exponential(self):
+        delays = list(itertools.islice(Backoff(initial_delay=1, max_delay=5, jitter=0), 5))
+        self.assertEqual(delays, [1, 2, 4, 5, 5])
+
+    def test_jitter(self):
+        for delay in itertools.islice(Backoff(initial_delay=2, max_delay=2, jitter=0.5), 20):
+            self.assertTrue(2 <= delay <= 3)
+
+    def test_timeout(self):
+        self.assertEqual(list(Backoff(timeout=0)), [])
+        delay = next(iter(Backoff(initial_delay=10, timeout=1)))
+        self.assertTrue(0 < delay <= 1)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, Backoff, initial_delay=-1)
+        self.assertRaises(ValueError, Backoff, factor=0.5)
+
+
+class TestWaitFor(unittest.TestCase):
+
+    def test_wait_for(self):
+        calls = iter([False, False, True])
+        waits = []
+        self.assertTrue(wait_for(lambda: next(calls), Backoff(initial_delay=0.01),
+                                 on_wait=waits.append))
+        self.assertEqual(len(waits), 2)
+
+    def test_timeout(self):
+        self.assertFalse(wait_for(lambda: False, Backoff(initial_delay=0.01, timeout=0.05)))
+
+
+class TestJSONCodec(unittest.TestCase):
+
+    def test_stdlib(self):
+        codec = JSONCodec('json')
+        self.assertEqual(codec.library, 'json')
+        obj = {'a': [1, 2.5, None, True], 'b': u'\xe9'}
+        self.assertEqual(codec.loads(codec.dumps(obj)), obj)
+        self.assertEqual(codec.loads(b'{"a": 1}'), {'a': 1})
+
+    def test_fallback(self):
+        # Non-string keys are rejected by orjson but accepted by json
+        codec = JSONCodec()
+        self.assertEqual(codec.loads(codec.dumps({1: 'x'})), {'1': 'x'})
+        self.assertRaises(ImportError, JSONCodec, 'nosuchjsonlib')
+
+    def test_stdlib_fallback(self):
+        # A None entry in sys.modules makes the import fail
+        saved = dict((_, sys.modules.get(_)) for _ in ('orjson', 'ujson'))
+        sys.modules.update(orjson=None, ujson=None)
+        try:
+            self.assertEqual(JSONCodec().library, 'json')
+        finally:
+            for name, module in saved.items():
+                if module is None:
+                    del sys.modules[name]
+                else:
+                    sys.modules[name] = module
+
+    def test_default(self):
+        self.assertEqual(default_json_codec.library, 'json')
+
+
+class TestIterJSONArray(unittest.TestCase):
+
+    def test_chunks(self):
+        items = [1, -2.5e3, u'\xe9"', {'a': [1, {}]}, [], None, True, 12345]
+        data = json.dumps(items, ensure_ascii=False).encode('utf-8')
+        for n in (1, 3, len(data)):
+            chunks = (data[i:i + n] for i in range(0, len(data), n))
+            self.assertEqual(list(iter_json_array(chunks)), items)
+        self.assertEqual(list(iter_json_array([b' [', b' ] '])), [])
+
+    def test_invalid(self):
+        for data in (b'', b'{}', b'[1,', b'[1 2]', b'[1,]'):
+            self.assertRaises(ValueError, list, iter_json_array([data]))
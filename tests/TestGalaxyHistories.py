@@ -114,6 +114,26 @@ class TestGalaxyHistories(GalaxyTestBase.GalaxyTestBase):
         dataset1_id = self._test_dataset(history_id)
         self._wait_and_verify_dataset(history_id, dataset1_id, b"1\t2\t3\n")
 
+    def test_download_history_datasets(self):
+        history_id = self.history["id"]
+        dataset1_id = self._test_dataset(history_id)
+        self._wait_for_history(history_id)
+        tempdir = tempfile.mkdtemp(prefix='bioblend_test_')
+        try:
+            manifest = self.gi.histories.download_history_datasets(
+                history_id, tempdir, name_template='{id}', manifest='manifest.json')
+            self.assertEqual([_['status'] for _ in manifest], ['downloaded'])
+            fn = os.path.join(tempdir, dataset1_id)
+            self.assertEqual(manifest[0]['path'], fn)
+            with open(fn, 'rb') as f:
+                self.assertEqual(f.read(), b"1\t2\t3\n")
+            self.assertTrue(os.path.exists(os.path.join(tempdir, 'manifest.json')))
+            manifest = self.gi.histories.download_history_datasets(
+                history_id, tempdir, name_template='{id}')
+            self.assertEqual([_['status'] for _ in manifest], ['skipped'])
+        finally:
+            shutil.rmtree(tempdir)
+
     def test_delete_history(self):
         result = self.gi.histories.delete_history(self.history['id'])
         self.assertTrue(result['deleted'])
@@ -3,10 +3,84 @@ Tests on the GalaxyInstance object itself.
 
 Use ``nose`` to run these unit tests.
 """
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import requests
+from requests_toolbelt import MultipartEncoder
+
 from test_util import unittest
 
 from bioblend.galaxy import GalaxyInstance
-from bioblend.galaxy.client import Client, ConnectionError
+from bioblend.galaxy.client import (Client, ConditionalGetCache, ConnectionError, ResponseCache,
+                                    RetryPolicy)
+from bioblend import galaxyclient
+try:
+    import asyncio
+    from bioblend.galaxy import aio
+except ImportError:
+    # Python < 3.4
+    aio = None
+
+
+class FakeResponse(object):
+    """
+    Streamed response to a (range) request for ``data``.
+    """
+    def __init__(self, data, start=0, end=None, interrupt_at=None, accept_ranges=True):
+        end = len(data) - 1 if end is None else end
+        self.data = data[:end + 1]
+        self.start = start
+        self.interrupt_at = interrupt_at
+        self.status_code = 206 if start or end < len(data) - 1 else 200
+        self.headers = {'content-length': str(end + 1 - start)}
+        if accept_ranges:
+            self.headers['accept-ranges'] = 'bytes'
+        if self.status_code == 206:
+            self.headers['content-range'] = 'bytes %d-%d/%d' % (start, end, len(data))
+
+    @property
+    def content(self):
+        return self.data
+
+    def json(self):
+        return json.loads(self.data.decode('utf-8'))
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for i in range(self.start, len(self.data), chunk_size):
+            if self.interrupt_at is not None and i >= self.interrupt_at:
+                raise requests.exceptions.ChunkedEncodingError('interrupted')
+            yield self.data[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+class FakeSession(object):
+    """
+    Serve ``data`` for any URL, interrupting the first full response at byte
+    ``interrupt_at``, and record the Range headers received.
+    """
+    def __init__(self, data, interrupt_at=None, accept_ranges=True):
+        self.data = data
+        self.interrupt_at = interrupt_at
+        self.accept_ranges = accept_ranges
+        self.ranges = []
+
+    def get(self, url, headers=None, **kwargs):
+        range_ = (headers or {}).get('Range')
+        self.ranges.append(range_)
+        if range_ is None or not self.accept_ranges:
+            return FakeResponse(self.data, interrupt_at=self.interrupt_at,
+                                accept_ranges=self.accept_ranges)
+        start, end = range_[len('bytes='):].split('-')
+        return FakeResponse(self.data, int(start), int(end) if end else None)
 
 
 class TestGalaxyInstance(unittest.TestCase):
@@ -15,13 +89,470 @@ class TestGalaxyInstance(unittest.TestCase):
         # "connect" to a galaxy instance that doesn't exist
         self.gi = GalaxyInstance("http://localhost:56789", key="whatever")
 
+    def test_shared_session(self):
+        self.assertIs(self.gi.histories.gi.session, self.gi.session)
+        self.assertIs(self.gi.libraries.gi.session, self.gi.session)
+        adapter = self.gi.session.get_adapter(self.gi.url)
+        self.assertEqual(adapter._pool_maxsize, 10)
+
+    def test_pool_size(self):
+        gi = GalaxyInstance("http://localhost:56789", key="whatever",
+                            pool_maxsize=32)
+        self.assertEqual(gi.session.get_adapter(gi.url)._pool_maxsize, 32)
+        self.assertRaises(ValueError, GalaxyInstance, "http://localhost:56789",
+                          key="whatever", pool_maxsize=0)
+
+    def test_show_many(self):
+        def show(id_, suffix=''):
+            if id_ == 'bad':
+                raise ConnectionError('not found')
+            return {'id': id_ + suffix}
+        ids = ['a', 'bad', 'c', 'd']
+        res = self.gi.jobs.show_many(ids, show=show, max_workers=3, suffix='!')
+        self.assertEqual(len(res), len(ids))
+        self.assertEqual(res[0], {'id': 'a!'})
+        self.assertIsInstance(res[1], ConnectionError)
+        self.assertEqual([_['id'] for _ in res[2:]], ['c!', 'd!'])
+
     def test_set_max_get_retries(self):
         self.gi.max_get_attempts = 3
-        self.assertEqual(3, Client.max_get_retries())
+        self.assertEqual(3, self.gi.retry_policy.max_attempts)
+        other_gi = GalaxyInstance("http://localhost:56789", key="whatever")
+        self.assertEqual(Client.max_get_retries(), other_gi.max_get_attempts)
 
     def test_set_retry_delay(self):
         self.gi.get_retry_delay = 5
-        self.assertEqual(5, Client.get_retry_delay())
+        self.assertEqual(5, self.gi.retry_policy.retry_delay)
+        self.assertRaises(ValueError, setattr, self.gi, 'get_retry_delay', -1)
+
+    def test_retry_policy(self):
+        policy = RetryPolicy(max_attempts=3)
+        self.assertEqual(policy.attempts('get'), 3)
+        self.assertEqual(policy.attempts('PUT'), 3)
+        self.assertEqual(policy.attempts('POST'), 1)
+        policy.retry_non_idempotent = True
+        self.assertEqual(policy.attempts('POST'), 3)
+        gi = GalaxyInstance("http://localhost:56789", key="whatever",
+                            retry_policy=policy)
+        self.assertIs(gi.retry_policy, policy)
+
+    def _retry_session(self, status_codes):
+        requests_sent = []
+
+        class Session(object):
+            def request(session, method, url, **kwargs):
+                requests_sent.append(method)
+                r = requests.Response()
+                r.status_code = status_codes[min(len(requests_sent), len(status_codes)) - 1]
+                return r
+        self.gi.session = Session()
+        return requests_sent
+
+    def test_retry_put(self):
+        self.gi.retry_policy = RetryPolicy(max_attempts=3, retry_delay=0)
+        requests_sent = self._retry_session([503, 200])
+        r = self.gi._request('PUT', 'http://localhost:56789/api/x')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(requests_sent, ['PUT', 'PUT'])
+
+    def test_retry_post(self):
+        self.gi.retry_policy = RetryPolicy(max_attempts=3, retry_delay=0)
+        requests_sent = self._retry_session([503, 200])
+        r = self.gi._request('POST', 'http://localhost:56789/api/x')
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(requests_sent, ['POST'])
+        self.gi.retry_policy.retry_non_idempotent = True
+        requests_sent = self._retry_session([503, 200])
+        r = self.gi._request('POST', 'http://localhost:56789/api/x')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(requests_sent, ['POST', 'POST'])
+
+    def test_resume_download(self):
+        data = b'0123456789' * 10
+        session = FakeSession(data, interrupt_at=30)
+        self.gi.session = session
+        self.gi.retry_policy = RetryPolicy(max_attempts=2, retry_delay=0)
+        fp = io.BytesIO()
+        self.assertEqual(self.gi._download('http://localhost:56789/x', fp, chunk_size=10), len(data))
+        self.assertEqual(fp.getvalue(), data)
+        self.assertEqual(session.ranges, [None, 'bytes=30-'])
+
+    def test_segmented_download(self):
+        data = b'0123456789' * 100
+        session = FakeSession(data)
+        self.gi.session = session
+        url = 'http://localhost:56789/x'
+        min_segment_size = galaxyclient.MIN_SEGMENT_SIZE
+        galaxyclient.MIN_SEGMENT_SIZE = 100
+        try:
+            fp = io.BytesIO()
+            size = self.gi._download(url, fp, chunk_size=64, r=session.get(url), segments=4)
+            self.assertEqual(size, len(data))
+            self.assertEqual(fp.getvalue(), data)
+            self.assertEqual(sorted(session.ranges[1:]),
+                             ['bytes=0-249', 'bytes=250-499', 'bytes=500-749', 'bytes=750-999'])
+            # Fall back to a single stream without range support
+            session = FakeSession(data, accept_ranges=False)
+            self.gi.session = session
+            fp = io.BytesIO()
+            self.gi._download(url, fp, r=session.get(url), segments=4)
+            self.assertEqual(fp.getvalue(), data)
+            self.assertEqual(session.ranges, [None])
+        finally:
+            galaxyclient.MIN_SEGMENT_SIZE = min_segment_size
+
+    def test_segmented_download_to_path(self):
+        data = ''.join('%09d\n' % i for i in range(100)).encode()
+        session = FakeSession(data)
+        self.gi.session = session
+        url = 'http://localhost:56789/x'
+        min_segment_size = galaxyclient.MIN_SEGMENT_SIZE
+        galaxyclient.MIN_SEGMENT_SIZE = 100
+        tempdir = tempfile.mkdtemp(prefix='bioblend_test_')
+        try:
+            path = os.path.join(tempdir, 'f')
+            self.gi.datasets._download_to_path({}, url, path, chunk_size=64, segments=4)
+            self.assertEqual(len(session.ranges), 5)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), data)
+            # Resume a partial download
+            with open(path + '.part', 'wb') as f:
+                f.write(data[:300])
+            self.gi.datasets._download_to_path({}, url, path, segments=4)
+            self.assertEqual(session.ranges[-1], 'bytes=300-')
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), data)
+        finally:
+            galaxyclient.MIN_SEGMENT_SIZE = min_segment_size
+            shutil.rmtree(tempdir)
+
+    def test_segmented_download_history_datasets(self):
+        data = ''.join('%09d\n' % i for i in range(100)).encode()
+        session = FakeSession(data)
+        self.gi.session = session
+        self.gi.histories.show_history = lambda *args, **kwargs: [
+            {'id': id_, 'name': id_, 'file_ext': 'txt', 'data_type': 'txt', 'file_size': len(data),
+             'state': 'ok', 'url': '/api/x', 'download_url': '/api/x/display'}
+            for id_ in ('a', 'b')]
+        min_segment_size = galaxyclient.MIN_SEGMENT_SIZE
+        galaxyclient.MIN_SEGMENT_SIZE = 100
+        tempdir = tempfile.mkdtemp(prefix='bioblend_test_')
+        try:
+            manifest = self.gi.histories.download_history_datasets(
+                'h', tempdir, name_template='{name}', segments=4)
+            self.assertEqual([_['status'] for _ in manifest], ['downloaded', 'downloaded'])
+            self.assertEqual(len([_ for _ in session.ranges if _]), 8)
+            for entry in manifest:
+                with open(entry['path'], 'rb') as f:
+                    self.assertEqual(f.read(), data)
+        finally:
+            galaxyclient.MIN_SEGMENT_SIZE = min_segment_size
+            shutil.rmtree(tempdir)
+
+    def test_download_many(self):
+        datasets = [{'id': 'a', 'name': 'x/y', 'file_size': 3, 'state': 'ok'},
+                    {'id': 'b', 'name': 'x/y', 'file_size': 3},
+                    {'id': 'c', 'name': 'z', 'file_size': 3, 'state': 'queued'},
+                    {'id': 'd', 'name': '..', 'file_size': 3},
+                    {'id': 'e', 'name': '', 'file_size': 3}]
+
+        def download(dataset, path):
+            with open(path, 'wb') as f:
+                f.write(b'abc')
+
+        tempdir = tempfile.mkdtemp(prefix='bioblend_test_')
+        try:
+            manifest = self.gi.datasets._download_many(datasets, tempdir, download,
+                                                       manifest='manifest.json')
+            self.assertEqual([_['status'] for _ in manifest],
+                             ['downloaded', 'downloaded', 'failed', 'downloaded', 'downloaded'])
+            self.assertEqual([os.path.basename(_['path']) for _ in manifest],
+                             ['x_y', 'x_y_b', 'z', 'd', 'e'])
+            with open(os.path.join(tempdir, 'manifest.json')) as f:
+                self.assertEqual(json.load(f), manifest)
+            manifest = self.gi.datasets._download_many(datasets[:2], tempdir, download)
+            self.assertEqual([_['status'] for _ in manifest], ['skipped', 'skipped'])
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_upload_stream(self):
+        data = b'x' * 100000
+        encoder = MultipartEncoder(fields={'files_0|file_data': ('f', io.BytesIO(data))})
+        transfers = []
+        stream = galaxyclient.UploadStream(encoder, chunk_size=16384,
+                                           progress=lambda p: transfers.append(p.transferred))
+        chunks = list(iter(lambda: stream.read(65536), b''))
+        self.assertTrue(all(len(_) <= 16384 for _ in chunks))
+        self.assertEqual(len(b''.join(chunks)), stream.len)
+        self.assertEqual(stream.transfer.transferred, stream.len)
+        self.assertEqual(transfers[-1], stream.len)
+        self.assertEqual(stream.transfer.eta, 0)
+
+    def test_chunked_upload(self):
+        requests_sent = []
+        failures = [4]
+
+        def make_post_request(url, payload, files_attached=False, **kwargs):
+            if url.endswith('/upload'):
+                offset = int(payload['session_start'])
+                if offset in failures:
+                    failures.remove(offset)
+                    raise ConnectionError('interrupted')
+                requests_sent.append((offset, payload['session_chunk'][1]))
+                return {'message': 'Successful.'}
+            requests_sent.append(payload['inputs']['files_0|file_data'])
+            return {'outputs': []}
+
+        self.gi.make_post_request = make_post_request
+        tempdir = tempfile.mkdtemp(prefix='bioblend_test_')
+        try:
+            path = os.path.join(tempdir, 'f.txt')
+            with open(path, 'wb') as f:
+                f.write(b'0123456789')
+            token = os.path.join(tempdir, 'token.json')
+            kwargs = dict(chunked=True, upload_chunk_size=4, resume_token=token)
+            self.assertRaises(ConnectionError, self.gi.tools.upload_file, path, 'h', **kwargs)
+            self.assertTrue(os.path.exists(token))
+            self.gi.tools.upload_file(path, 'h', **kwargs)
+            self.assertEqual(requests_sent[:3], [(0, b'0123'), (4, b'4567'), (8, b'89')])
+            self.assertEqual(requests_sent[3]['name'], 'f.txt')
+            self.assertFalse(os.path.exists(token))
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_chunked_upload_retry(self):
+        stored = []
+        failures = [4]
+        tool_posts = []
+
+        def make_post_request(url, payload, files_attached=False, **kwargs):
+            if url.endswith('/upload'):
+                offset = int(payload['session_start'])
+                if offset != len(b''.join(stored)):
+                    raise ConnectionError('Unexpected response', body='Incorrect session start.',
+                                          status_code=400)
+                stored.append(payload['session_chunk'][1])
+                if offset in failures:
+                    # stored by Galaxy, but lost by a proxy
+                    failures.remove(offset)
+                    raise ConnectionError('Unexpected response', status_code=503)
+                return {'message': 'Successful.'}
+            tool_posts.append(payload['inputs']['files_0|file_data'])
+            return {'outputs': []}
+
+        self.gi.make_post_request = make_post_request
+        self.gi.retry_policy = RetryPolicy(max_attempts=3, retry_delay=0)
+        tempdir = tempfile.mkdtemp(prefix='bioblend_test_')
+        try:
+            path = os.path.join(tempdir, 'f.txt')
+            with open(path, 'wb') as f:
+                f.write(b'0123456789')
+            token = os.path.join(tempdir, 'token.json')
+            kwargs = dict(chunked=True, upload_chunk_size=4, resume_token=token)
+            self.gi.tools.upload_file(path, 'h', **kwargs)
+            self.assertEqual(stored, [b'0123', b'4567', b'89'])
+            self.assertEqual(len(tool_posts), 1)
+            # Resume an upload whose chunks have all been sent already
+            st = os.stat(path)
+            with open(token, 'w') as f:
+                json.dump({'session_id': 's', 'offset': 10, 'size': st.st_size,
+                           'mtime': st.st_mtime}, f)
+            self.gi.tools.upload_file(path, 'h', **kwargs)
+            self.assertEqual(len(stored), 3)
+            self.assertEqual(tool_posts[1]['session_id'], 's')
+            self.assertFalse(os.path.exists(token))
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_upload_files(self):
+        payloads = []
+
+        def make_post_request(url, payload, files_attached=False, **kwargs):
+            payloads.append(json.loads(payload['inputs']))
+            # Outputs in another order than the files
+            return {'outputs': [{'id': '2', 'name': 'b'}, {'id': '1', 'name': 'a'},
+                                {'id': '3', 'name': 'renamed'}]}
+
+        self.gi.make_post_request = make_post_request
+        tempdir = tempfile.mkdtemp(prefix='bioblend_test_')
+        try:
+            paths = []
+            for name in ('a', 'b', 'c'):
+                paths.append(os.path.join(tempdir, name))
+                with open(paths[-1], 'w') as f:
+                    f.write(name)
+            res = self.gi.tools.upload_files(paths, 'h')
+            self.assertEqual([_['id'] for _ in res['outputs']], ['1', '2', '3'])
+            self.assertEqual(payloads[0]['file_count'], 3)
+            self.assertEqual(payloads[0]['files_2|NAME'], 'c')
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_iter_history_contents(self):
+        items = [{'id': str(i), 'deleted': i == 3, 'visible': True,
+                  'history_content_type': 'dataset'} for i in range(7)]
+        offsets = []
+
+        def make_get_request(url, params=None, **kwargs):
+            offsets.append(params['offset'])
+            page = items[params['offset']:params['offset'] + params['limit']]
+            return FakeResponse(json.dumps(page).encode())
+
+        self.gi.make_get_request = make_get_request
+        res = self.gi.histories.iter_history_contents('h', deleted=False, limit=3)
+        self.assertEqual([_['id'] for _ in res], ['0', '1', '2', '4', '5', '6'])
+        self.assertEqual(offsets, [0, 3, 6])
+        # A server without pagination returns the whole list each time
+        self.gi.make_get_request = lambda url, params=None, **kwargs: FakeResponse(
+            json.dumps(items).encode())
+        res = self.gi.histories.iter_history_contents('h', limit=7)
+        self.assertEqual(len(list(res)), 7)
+
+    def test_iter_get(self):
+        tools = [{'id': str(i), 'name': 'even' if i % 2 else 'odd'} for i in range(5)]
+        requests_sent = []
+
+        def make_get_request(url, params=None, **kwargs):
+            requests_sent.append((url.rsplit('/', 1)[-1], kwargs.get('stream')))
+            if url.endswith('/jobs'):
+                return FakeResponse(b'[{"id": "j1"}, {"id": ')
+            return FakeResponse(json.dumps(tools).encode())
+
+        self.gi.make_get_request = make_get_request
+        res = self.gi.tools.iter_tools(name='odd')
+        self.assertEqual(requests_sent, [])
+        self.assertEqual([_['id'] for _ in res], ['0', '2', '4'])
+        self.assertEqual(requests_sent, [('tools', True)])
+        jobs = self.gi.jobs.iter_jobs()
+        self.assertEqual(next(jobs), {'id': 'j1'})
+        self.assertRaises(ConnectionError, next, jobs)
+
+    def test_server_side_filters(self):
+        histories = [{'id': 'a', 'name': 'x', 'deleted': False},
+                     {'id': 'b', 'name': 'y', 'deleted': False}]
+        requests_sent = []
+
+        def make_get_request(url, params=None, **kwargs):
+            requests_sent.append((url.rsplit('/', 1)[-1], params))
+            if url.endswith('/b'):
+                return FakeResponse(json.dumps(histories[1]).encode())
+            if url.endswith('/c'):
+                r = FakeResponse(b'{}')
+                r.status_code = 404
+                return r
+            # An old server ignoring the name filter
+            return FakeResponse(json.dumps(histories).encode())
+
+        self.gi.make_get_request = make_get_request
+        self.assertEqual(self.gi.histories.get_histories(history_id='b'), [histories[1]])
+        self.assertEqual(self.gi.histories.get_histories(history_id='b', deleted=True), [])
+        self.assertEqual(self.gi.histories.get_histories(history_id='c'), [])
+        self.assertEqual(self.gi.histories.get_histories(name='x'), [histories[0]])
+        self.assertEqual(self.gi.histories.get_histories(name='x'), [histories[0]])
+        self.assertEqual(requests_sent[-2:], [('histories', {'q': 'name', 'qv': 'x'}),
+                                              ('histories', None)])
+
+    def test_response_cache(self):
+        urls = []
+
+        def make_get_request(url, params=None, **kwargs):
+            urls.append(url.rsplit('/', 1)[-1])
+            return FakeResponse(json.dumps([{'id': len(urls)}]).encode())
+
+        self.gi.make_get_request = make_get_request
+        self.assertIsNone(self.gi.cache)
+        self.gi.cache = ResponseCache(maxsize=2)
+        self.assertEqual(self.gi.genomes.get_genomes(), [{'id': 1}])
+        genomes = self.gi.genomes.get_genomes()
+        self.assertEqual(genomes, [{'id': 1}])
+        genomes.append(None)
+        self.gi._key = 'other'
+        self.assertEqual(self.gi.genomes.get_genomes(), [{'id': 1}])
+        self.assertEqual((self.gi.cache.hits, self.gi.cache.misses), (2, 1))
+        # Not cached
+        self.gi.histories.get_histories()
+        self.gi.histories.get_histories()
+        # Different parameters, then LRU eviction
+        self.gi.tools.get_tool_panel()
+        self.gi.datatypes.get_sniffers()
+        self.gi.genomes.get_genomes()
+        self.assertEqual(urls, ['genomes', 'histories', 'histories', 'tools', 'sniffers', 'genomes'])
+        self.gi.cache.invalidate('datatypes')
+        self.gi.datatypes.get_sniffers()
+        self.assertEqual(urls[-1], 'sniffers')
+        self.assertEqual(len(self.gi.cache), 2)
+
+    def test_conditional_get(self):
+        requests_sent = []
+
+        def make_get_request(url, params=None, headers=None, **kwargs):
+            requests_sent.append(headers)
+            if headers and headers.get('If-None-Match') == '"v1"':
+                r = FakeResponse(b'')
+                r.status_code = 304
+                return r
+            r = FakeResponse(json.dumps({'id': 'h', 'n': len(requests_sent)}).encode())
+            r.headers['ETag'] = '"v1"'
+            return r
+
+        gi = GalaxyInstance("http://localhost:56789", key="whatever", conditional_get=True)
+        gi.make_get_request = make_get_request
+        first = gi.histories.show_history('h')
+        first['n'] = None
+        self.assertEqual(gi.histories.show_history('h'), {'id': 'h', 'n': 1})
+        self.assertEqual(requests_sent, [None, {'If-None-Match': '"v1"'}])
+        self.assertEqual(gi.conditional_get.hits, 1)
+
+    def test_conditional_get_maxbytes(self):
+        store = ConditionalGetCache(maxbytes=10)
+
+        def response(content):
+            r = FakeResponse(content)
+            r.headers['ETag'] = '"v1"'
+            return r
+        store.put('a', None, response(b'123456'))
+        store.put('b', None, response(b'1234'))
+        self.assertEqual(len(store), 2)
+        # the least recently used body is evicted to stay within maxbytes
+        store.get('a')
+        store.put('c', None, response(b'12'))
+        self.assertIsNone(store.get('b'))
+        self.assertEqual(store.get('a')[1], b'123456')
+        # bodies larger than maxbytes are not stored
+        store.put('d', None, response(b'x' * 11))
+        self.assertIsNone(store.get('d'))
+        self.assertEqual(len(store), 2)
+        store.clear()
+        self.assertEqual(store._entries.nbytes, 0)
+
+    def test_library_folders(self):
+        contents = [{'id': 'F1', 'name': '/', 'type': 'folder'},
+                    {'id': 'F2', 'name': '/sub', 'type': 'folder'},
+                    {'id': 'd1', 'name': '/sub/x', 'type': 'file'}]
+        urls = []
+
+        def make_get_request(url, params=None, **kwargs):
+            urls.append(url.split('/api/')[1])
+            if url.endswith('/contents'):
+                return FakeResponse(json.dumps(contents).encode())
+            return FakeResponse(json.dumps({'id': 'l', 'root_folder_id': 'F1'}).encode())
+
+        def make_post_request(url, payload, **kwargs):
+            return [{'id': 'F3', 'name': payload['name'], 'url': '/api/folders/F3'}]
+
+        self.gi.make_get_request = make_get_request
+        self.gi.make_post_request = make_post_request
+        libraries = self.gi.libraries
+        self.assertEqual(libraries._get_root_folder_id('l'), 'F1')
+        self.assertEqual(libraries._get_root_folder_id('l'), 'F1')
+        self.assertEqual(libraries.get_folders('l', name='/sub'), [contents[1]])
+        self.assertEqual(libraries.get_folders('l', folder_id='F1'), [contents[0]])
+        libraries.create_folder('l', 'new', base_folder_id='F2')
+        self.assertEqual(libraries.get_folders('l', name='/sub/new')[0]['id'], 'F3')
+        self.assertEqual(urls, ['libraries/l', 'libraries/l/contents'])
+        self.assertEqual(libraries.get_folders('l', name='/missing'), [])
+        self.assertEqual(len(libraries.get_folders('l')), 2)
+        self.assertEqual(urls[2:], ['libraries/l/contents', 'libraries/l/contents'])
 
     def test_get_retry(self):
         # We set the client to try twice, with a delay of 5 seconds between
@@ -38,3 +569,29 @@ class TestGalaxyInstance(unittest.TestCase):
             end = time.time()
         duration = end - start
         self.assertGreater(duration, self.gi.get_retry_delay, "Didn't seem to retry long enough")
+
+
+@unittest.skipIf(aio is None, "asyncio not available")
+class TestAsyncGalaxyInstance(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.gi = aio.GalaxyInstance("http://localhost:56789", key="whatever",
+                                     max_concurrency=4, loop=self.loop)
+
+    def tearDown(self):
+        self.gi.close()
+        self.loop.close()
+
+    def test_clients(self):
+        for name in ('histories', 'datasets', 'jobs', 'tools', 'workflows', 'libraries'):
+            self.assertIs(getattr(self.gi, name).client, getattr(self.gi.gi, name))
+        self.assertEqual(self.gi.gi.session.get_adapter(self.gi.url)._pool_maxsize, 4)
+
+    def test_awaitable(self):
+        futures = [self.gi.libraries.get_libraries() for _ in range(3)]
+        results = self.loop.run_until_complete(
+            asyncio.gather(*futures, return_exceptions=True))
+        self.assertEqual(len(results), 3)
+        for r in results:
+            self.assertIsInstance(r, ConnectionError)
@@ -1,4 +1,5 @@
 # pylint: disable=C0103,E1101
+import datetime
 import json
 import os
 import shutil
@@ -127,6 +128,7 @@ class TestWrapper(unittest.TestCase):
         self.assertEqual(self.d['b'][0], 2)
         self.assertRaises(AttributeError, getattr, self.w, 'foo')
         self.assertRaises(AttributeError, setattr, self.w, 'foo', 0)
+        self.assertRaises(ValueError, MockWrapper, {'a': datetime.datetime.now()})
 
     def test_taint(self):
         self.assertFalse(self.w.is_modified)
@@ -143,6 +145,38 @@ class TestWrapper(unittest.TestCase):
         w.b[0] = 111
         self.assertEqual(self.w.b[0], 2)
 
+    def test_owned(self):
+        w = MockWrapper(wrappers._owned(self.d))
+        self.assertIs(w.wrapped, self.d)
+        self.assertEqual(w.b, [2, 3])
+        self.assertRaises(TypeError, MockWrapper, wrappers._owned([]))
+
+    def test_compact(self):
+        d = {'id': 'x', 'name': 'a', 'type': 'file', 'state': 'ok', 'hid': 1}
+        info = wrappers.HistoryContentInfo(d)
+        self.assertFalse(hasattr(info, '__dict__'))
+        self.assertEqual((info.id, info.state, info.deleted), ('x', 'ok', None))
+        self.assertEqual(info.wrapped, d)
+        info.name = 'b'
+        self.assertEqual(info.wrapped['name'], 'b')
+        self.assertTrue(info.is_modified)
+        self.assertRaises(AttributeError, setattr, info, 'deleted', True)
+        info.hid = 2
+        self.assertEqual(info.wrapped['hid'], 2)
+        info.unmap()
+        self.assertIsNone(info.id)
+        self.assertEqual(info.wrapped['id'], 'x')
+
+    def test_compact_keys(self):
+        d = {'id': 'x', 'name': 'a', 'type': 'file'}
+        infos = [wrappers.LibraryContentInfo(dict(d)) for _ in range(2)]
+        self.assertIs(infos[0]._keys, infos[1]._keys)
+        # the shared key tuples are bounded per class
+        for i in range(wrappers._MAX_ROW_KEYS + 1):
+            wrappers.LibraryContentInfo(dict(d, **{'k%d' % i: i}))
+        self.assertEqual(len(wrappers._ROW_KEYS[wrappers.LibraryContentInfo]),
+                         wrappers._MAX_ROW_KEYS)
+
     def test_kwargs(self):
         parent = MockWrapper({'a': 10})
         w = MockWrapper(self.d, parent=parent)
@@ -150,6 +184,139 @@ class TestWrapper(unittest.TestCase):
         self.assertRaises(AttributeError, setattr, w, 'parent', 0)
 
 
+class TestIdentityMap(unittest.TestCase):
+
+    class Entity(object):
+        refreshed = 0
+
+        def refresh(self):
+            self.refreshed += 1
+            return self
+
+    def test_get(self):
+        imap = galaxy_instance.IdentityMap()
+        fetched = []
+
+        def fetch():
+            fetched.append(self.Entity())
+            return fetched[-1]
+        obj = imap.get(self.Entity, 'a', fetch)
+        self.assertIs(imap.get(self.Entity, 'a', fetch), obj)
+        self.assertIsNot(imap.get(object, 'a', fetch), obj)
+        self.assertEqual((len(fetched), imap.hits, imap.misses), (2, 1, 2))
+        imap.forget(self.Entity, 'a')
+        self.assertIsNot(imap.get(self.Entity, 'a', fetch), obj)
+
+    def test_ttl(self):
+        imap = galaxy_instance.IdentityMap(ttl=0)
+        obj = imap.get(self.Entity, 'a', self.Entity)
+        # refreshed in place when stale
+        self.assertIs(imap.get(self.Entity, 'a', self.Entity), obj)
+        self.assertEqual(obj.refreshed, 1)
+
+
+class TestLibraryDownload(unittest.TestCase):
+
+    class Dataset(object):
+        def __init__(self, id_):
+            self.id = id_
+            self.wrapped = {'id': id_, 'name': 'x', 'file_size': 3, 'state': 'ok'}
+
+        def download(self, f, chunk_size=None):
+            f.write(b'abc')
+
+    def test_download_all(self):
+        gi = galaxy_instance.GalaxyInstance('http://localhost:56789', 'whatever')
+        infos = [wrappers.LibraryContentInfo({'id': id_, 'name': '/' + id_, 'type': 'file'})
+                 for id_ in ('a', 'b')]
+        lib = wrappers.Library({'id': 'l', 'name': 'L'}, content_infos=infos, gi=gi)
+
+        def get_dataset(ds_id):
+            if ds_id == 'b':
+                raise ConnectionError('not found')
+            return self.Dataset(ds_id)
+        object.__setattr__(lib, 'get_dataset', get_dataset)
+        tempdir = tempfile.mkdtemp(prefix='bioblend_test_')
+        try:
+            manifest = lib.download_all(tempdir)
+            self.assertEqual([_['status'] for _ in manifest], ['downloaded', 'failed'])
+            self.assertEqual(os.path.basename(manifest[1]['path']), 'b')
+            with open(manifest[0]['path'], 'rb') as f:
+                self.assertEqual(f.read(), b'abc')
+        finally:
+            shutil.rmtree(tempdir)
+
+
+class TestContentInfosMaxAge(unittest.TestCase):
+
+    def setUp(self):
+        self.gi = galaxy_instance.GalaxyInstance('http://localhost:56789', 'whatever')
+        self.hist = wrappers.History({'id': 'h', 'name': 'a'}, gi=self.gi,
+                                     content_infos_max_age=5)
+        self.gi.gi.histories.update_history = lambda *args, **kwargs: 200
+        self.gi.gi.histories.show_history = lambda id_, contents=False, **kwargs: (
+            [] if contents else {'id': id_, 'name': 'b'})
+
+    def test_default(self):
+        self.assertIsNone(wrappers.History({'id': 'h'}).content_infos_max_age)
+
+    def test_update(self):
+        self.hist.update(name='b')
+        self.assertEqual(self.hist.name, 'b')
+        self.assertEqual(self.hist.content_infos_max_age, 5)
+
+    def test_refresh(self):
+        self.hist.refresh()
+        self.assertEqual(self.hist.name, 'b')
+        self.assertEqual(self.hist.content_infos_max_age, 5)
+
+
+class TestRefreshDatasets(unittest.TestCase):
+
+    def setUp(self):
+        self.gi = galaxy_instance.GalaxyInstance('http://localhost:56789', 'whatever')
+        self.hist = wrappers.History({'id': 'h', 'name': 'H'}, gi=self.gi)
+        self.lib = wrappers.Library({'id': 'l', 'name': 'L'}, gi=self.gi)
+        self.calls = []
+        self.refreshed = []
+
+        def show_history(hist_id, contents=False, details=None, **kwargs):
+            self.calls.append((hist_id, contents, details))
+            # no details for 'c', as if Galaxy did not return them
+            return [{'id': id_, 'name': id_, 'state': 'ok', 'file_size': 3}
+                    if id_ != 'c' else {'id': id_, 'name': id_, 'state': 'ok'}
+                    for id_ in ('a', 'b', 'c')]
+        self.gi.gi.histories.show_history = show_history
+
+    def _dataset(self, cls, id_, container):
+        ds = cls({'id': id_, 'name': id_, 'state': 'queued'}, container, gi=self.gi)
+        object.__setattr__(ds, 'refresh', lambda: self.refreshed.append(ds.id))
+        return ds
+
+    def test_refresh(self):
+        hdas = [self._dataset(wrappers.HistoryDatasetAssociation, id_, self.hist)
+                for id_ in ('a', 'b', 'c')]
+        ldda = self._dataset(wrappers.LibraryDatasetDatasetAssociation, 'd', self.lib)
+        self.gi._refresh_datasets(hdas + [ldda])
+        self.assertEqual(self.calls, [('h', True, 'a,b,c')])
+        self.assertEqual([_.state for _ in hdas], ['ok', 'ok', 'queued'])
+        self.assertEqual(hdas[0].file_size, 3)
+        self.assertEqual(sorted(self.refreshed), ['c', 'd'])
+
+    def test_refresh_all_details(self):
+        hdas = [self._dataset(wrappers.HistoryDatasetAssociation, id_, self.hist)
+                for id_ in ('a', 'b')]
+        max_details_ids = galaxy_instance._MAX_DETAILS_IDS
+        galaxy_instance._MAX_DETAILS_IDS = 1
+        try:
+            self.gi._refresh_datasets(hdas)
+        finally:
+            galaxy_instance._MAX_DETAILS_IDS = max_details_ids
+        self.assertEqual(self.calls, [('h', True, 'all')])
+        self.assertEqual([_.state for _ in hdas], ['ok', 'ok'])
+        self.assertEqual(self.refreshed, [])
+
+
 class TestWorkflow(unittest.TestCase):
 
     def setUp(self):
@@ -253,6 +420,18 @@ class TestGalaxyInstance(GalaxyObjectsTestBase):
         hist.delete(purge=True)
         self.assertFalse(hist.is_mapped)
 
+    def test_history_list_lazy(self):
+        name = 'test_%s' % uuid.uuid4().hex
+        hist = self.gi.histories.create(name)
+        try:
+            hist.paste_content(FOO_DATA)
+            lazy = self.gi.histories.list(name=name, lazy=True, max_workers=2)
+            self.assertEqual([_.id for _ in lazy], [hist.id])
+            self.assertIsNone(lazy[0]._content_infos)
+            self.assertEqual(lazy[0].dataset_ids, hist.dataset_ids)
+        finally:
+            hist.delete(purge=True)
+
     def test_workflow_from_str(self):
         with open(SAMPLE_FN) as f:
             wf = self.gi.workflows.import_new(f.read())
@@ -447,6 +626,20 @@ class TestLibrary(GalaxyObjectsTestBase):
             ds = self.lib.upload_from_local(f.name)
         self.__check_datasets([ds])
 
+    def test_upload_files(self):
+        tempdir = tempfile.mkdtemp(prefix='bioblend_test_')
+        try:
+            fnames = []
+            for i in range(3):
+                fnames.append(os.path.join(tempdir, 'f%d.txt' % i))
+                with open(fnames[-1], 'w') as f:
+                    f.write(FOO_DATA)
+            dss = self.lib.upload_files(fnames, max_workers=2)
+        finally:
+            shutil.rmtree(tempdir)
+        self.assertEqual(len(dss), 3)
+        self.__check_datasets(dss)
+
     def test_datasets_from_fs(self):
         bnames = ['f%d.txt' % i for i in range(2)]
         dss, fnames = upload_from_fs(self.lib, bnames)
@@ -565,10 +758,34 @@ class TestHistory(GalaxyObjectsTestBase):
             hda = self.hist.upload_file(f.name)
         self.__check_dataset(hda)
 
+    def test_upload_files(self):
+        tempdir = tempfile.mkdtemp(prefix='bioblend_test_')
+        try:
+            fnames = []
+            for i in range(3):
+                fnames.append(os.path.join(tempdir, 'f%d.txt' % i))
+                with open(fnames[-1], 'w') as f:
+                    f.write(FOO_DATA)
+            hdas = self.hist.upload_files(fnames, files_per_request=2)
+        finally:
+            shutil.rmtree(tempdir)
+        self.assertEqual([_.name for _ in hdas], ['f0.txt', 'f1.txt', 'f2.txt'])
+        for hda in hdas:
+            self.__check_dataset(hda)
+
     def test_paste_content(self):
         hda = self.hist.paste_content(FOO_DATA)
         self.__check_dataset(hda)
 
+    def test_content_infos_tracking(self):
+        hda = self.hist.paste_content(FOO_DATA)
+        self.assertEqual(self.hist.dataset_ids, [hda.id])
+        # changes made by other means are seen once the content infos expire
+        other_hda_id = self.gi.gi.tools.paste_content(FOO_DATA, self.hist.id)['outputs'][0]['id']
+        self.assertEqual(self.hist.dataset_ids, [hda.id])
+        self.hist.set_content_infos_max_age(0)
+        self.assertEqual(sorted(self.hist.dataset_ids), sorted([hda.id, other_hda_id]))
+
     def test_get_dataset(self):
         hda = self.hist.paste_content(FOO_DATA)
         retrieved = self.hist.get_dataset(hda.id)